@@ -3,12 +3,19 @@ from fastapi.security import OAuth2PasswordRequestForm
 import time
 from datetime import timedelta
 
-from app.models.user import UserCreate, User, Token
+from app.models.user import UserCreate, UserUpdate, User, Token, RefreshRequest
 from app.services.auth import (
     authenticate_user,
     create_access_token,
     get_password_hash,
     get_current_active_user,
+    update_user,
+    reserve_email,
+    release_email,
+    create_stateless_access_token,
+    issue_refresh_token,
+    consume_refresh_token,
+    get_user_by_id,
 )
 from app.core.config import settings
 from app.db.meilisearch import get_meilisearch_client
@@ -21,38 +28,40 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 @router.post("/register", response_model=User)
 async def register_user(user_data: UserCreate):
     client = await get_meilisearch_client()
+    user_id = str(uuid.uuid4())  # Générer un ID unique
 
-    # Vérifier si l'utilisateur existe déjà
-    result = await client.index(settings.USER_INDEX).search(
-        filter=f"email = '{user_data.email}'", limit=1
-    )
-
-    if result.hits:
+    # Réserver l'email (vérifie aussi que l'utilisateur n'existe pas déjà)
+    if not await reserve_email(user_data.email, user_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
         )
 
-    # Créer un nouvel utilisateur
-    hashed_password = get_password_hash(user_data.password)
-    user_dict = user_data.dict()
-    del user_dict["password"]
-
-    # Définir le premier utilisateur comme admin
-    count_result = await client.index(settings.USER_INDEX).get_stats()
-    is_first_user = count_result.number_of_documents == 0
-
-    user_in_db = {
-        **user_dict,
-        "hashed_password": hashed_password,
-        "is_admin": is_first_user,
-        "id": str(uuid.uuid4()),  # Générer un ID unique
-        "is_active": True,  # Par défaut, actif
-        "created_at": int(time.time()),  # Timestamp en secondes
-        "updated_at": int(time.time()),  # Timestamp en secondes
-    }
-
-    # Ajouter l'utilisateur à Meilisearch
-    await client.index(settings.USER_INDEX).add_documents([user_in_db])
+    try:
+        # Créer un nouvel utilisateur
+        hashed_password = await get_password_hash(user_data.password)
+        user_dict = user_data.dict()
+        del user_dict["password"]
+
+        # Définir le premier utilisateur comme admin
+        count_result = await client.index(settings.USER_INDEX).get_stats()
+        is_first_user = count_result.number_of_documents == 0
+
+        user_in_db = {
+            **user_dict,
+            "hashed_password": hashed_password,
+            "is_admin": is_first_user,
+            "id": user_id,
+            "is_active": True,  # Par défaut, actif
+            "created_at": int(time.time()),  # Timestamp en secondes
+            "updated_at": int(time.time()),  # Timestamp en secondes
+        }
+
+        # Ajouter l'utilisateur à Meilisearch
+        await client.index(settings.USER_INDEX).add_documents([user_in_db])
+    except Exception:
+        # Libérer l'email si la création a échoué
+        await release_email(user_data.email)
+        raise
 
     # Retourner l'utilisateur sans le mot de passe hashé
     created_user = User(**user_in_db)
@@ -69,6 +78,9 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    if settings.STATELESS_ACCESS_TOKENS:
+        return await issue_token_pair(User(**user.model_dump()))
+
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": str(user.id)}, expires_delta=access_token_expires
@@ -77,6 +89,70 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+async def issue_token_pair(user: User) -> dict:
+    return {
+        "access_token": create_stateless_access_token(user),
+        "token_type": "bearer",
+        "refresh_token": await issue_refresh_token(user.id),
+        "expires_in": settings.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshRequest):
+    """
+    Échange un jeton de rafraîchissement (usage unique) contre une nouvelle paire de jetons.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    user_id = await consume_refresh_token(request.refresh_token)
+    if user_id is None:
+        raise credentials_exception
+
+    user = await get_user_by_id(user_id)
+    if user is None or not user.is_active:
+        raise credentials_exception
+
+    return await issue_token_pair(user)
+
+
+@router.post("/logout")
+async def logout(request: RefreshRequest):
+    """
+    Révoque un jeton de rafraîchissement.
+    """
+    await consume_refresh_token(request.refresh_token)
+    return {"message": "Logged out successfully"}
+
+
 @router.get("/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
+
+
+
+@router.put("/users/{user_id}", response_model=User)
+async def update_user_account(
+    user_id: str,
+    user_data: UserUpdate,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Met à jour (ou désactive) un compte utilisateur. Réservé aux administrateurs.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
+        )
+
+    updated_user = await update_user(user_id, user_data)
+    if updated_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return updated_user
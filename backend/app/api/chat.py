@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request, Response, Query
 from fastapi.responses import StreamingResponse, JSONResponse
-from typing import List, Dict, Any, AsyncGenerator
+from typing import List, AsyncGenerator, Optional
 import uuid
 import json
 import asyncio
@@ -15,22 +15,33 @@ from app.models.chat import (
     MessageStreamRequest,
     ChatWithMessages,
     ChatResponse,
+    MessagePage,
     StreamSession,
 )
 from app.models.models import CompletionRequest
 from app.services.auth import get_current_active_user
-from app.services.llm import (
-    get_completion,
-    start_streaming_completion,
-    read_stream_messages,
+from app.services.llm import get_completion
+from app.services.streams import read_stream_messages
+from app.services.cancellation import request_cancel
+from app.services.generation import build_generation_job, run_generation
+from app.services.title_generator import title_batcher
+from app.services.job_queue import enqueue_generation
+from app.services.chat_history import (
+    get_message_window,
+    get_recent_messages,
 )
-from app.services.title_generator import generate_chat_title
+from app.services.context import build_context, with_token_count
 from app.db.meilisearch import get_meilisearch_client
+from app.db.write_buffer import write_buffer
+from app.db.repository import get_owned, keyset_page, quote_filter_value
 from app.core.config import settings
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Champs affichés par la barre latérale
+CHAT_LIST_FIELDS = ["id", "title", "model", "user_id", "created_at", "updated_at"]
+
 
 @router.post("", response_model=Chat)
 async def create_chat(
@@ -62,46 +73,102 @@ async def create_chat(
             "content": chat_data.system_prompt,
             "created_at": now,
         }
-        await client.index(settings.MESSAGE_INDEX).add_documents([system_message])
+        write_buffer.add_documents(settings.MESSAGE_INDEX, [system_message])
 
     return Chat(**chat_dict)
 
 
 @router.get("", response_model=List[Chat])
-async def list_chats(current_user: User = Depends(get_current_active_user)):
-    client = await get_meilisearch_client()
-
-    result = await client.index(settings.CHAT_INDEX).search(
-        filter=f"user_id = {current_user.id}", sort=["created_at:desc"]
+async def list_chats(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    List the user's chats, most recently updated first.
+    The cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    chats, next_cursor = await keyset_page(
+        settings.CHAT_INDEX,
+        f"user_id = {quote_filter_value(current_user.id)}",
+        limit=limit,
+        cursor=cursor,
+        fields=CHAT_LIST_FIELDS,
     )
 
-    return [Chat(**chat) for chat in result.hits]
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
+    return [Chat(**chat) for chat in chats]
 
-@router.get("/{chat_id}", response_model=ChatWithMessages)
-async def get_chat(chat_id: str, current_user: User = Depends(get_current_active_user)):
-    client = await get_meilisearch_client()
 
+@router.get("/{chat_id}", response_model=ChatWithMessages)
+async def get_chat(
+    chat_id: str,
+    last: Optional[int] = Query(None, ge=1, le=settings.MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get a chat with its most recent messages.
+    `last` limits the messages to the N most recent ones (lightweight mode);
+    older messages are loaded through GET /chat/{chat_id}/messages.
+    """
     # Get the chat
-    chat_result = await client.index(settings.CHAT_INDEX).search(
-        filter=f"id = {chat_id} AND user_id = {current_user.id}", limit=1
-    )
+    chat_data = await get_owned(settings.CHAT_INDEX, chat_id, current_user.id)
 
-    if not chat_result.hits:
+    if chat_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found"
         )
 
-    chat = Chat(**chat_result.hits[0])
+    chat = Chat(**chat_data)
+
+    # Get the newest messages
+    messages = await get_recent_messages(chat_id, last or settings.CONTEXT_MESSAGE_LIMIT)
+
+    return ChatWithMessages(
+        **chat.dict(), messages=[Message(**msg) for msg in messages]
+    )
+
+
+@router.get("/{chat_id}/messages", response_model=MessagePage)
+async def list_messages(
+    chat_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(settings.MESSAGE_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get a window of messages in chronological order, newest window first.
+    Pass `before_cursor` as `before` to load older messages and
+    `after_cursor` as `after` to load newer ones.
+    """
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either 'before' or 'after', not both",
+        )
 
-    # Get the messages
-    messages_result = await client.index(settings.MESSAGE_INDEX).search(
-        filter=f"chat_id = {chat_id}", sort=["created_at:asc"], limit=100
+    chat_data = await get_owned(
+        settings.CHAT_INDEX, chat_id, current_user.id, fields=["id"]
     )
 
-    messages = [Message(**msg) for msg in messages_result.hits]
+    if chat_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found"
+        )
 
-    return ChatWithMessages(**chat.dict(), messages=messages)
+    messages, before_cursor, after_cursor = await get_message_window(
+        chat_id, limit, before=before, after=after
+    )
+
+    return MessagePage(
+        messages=[Message(**msg) for msg in messages],
+        before_cursor=before_cursor,
+        after_cursor=after_cursor,
+    )
 
 
 @router.post("/{chat_id}/messages", response_model=ChatResponse)
@@ -114,88 +181,102 @@ async def add_message(
     """
     Non-streaming message endpoint (for backward compatibility)
     """
-    client = await get_meilisearch_client()
-
     # Verify that the chat exists and belongs to the user
-    chat_result = await client.index(settings.CHAT_INDEX).search(
-        filter=f"id = {chat_id} AND user_id = {current_user.id}", limit=1
-    )
+    chat_data = await get_owned(settings.CHAT_INDEX, chat_id, current_user.id)
 
-    if not chat_result.hits:
+    if chat_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found"
         )
 
-    chat = Chat(**chat_result.hits[0])
+    chat = Chat(**chat_data)
 
     # Add the user message
     message_id = str(uuid.uuid4())
     now = int(time.time())
 
-    user_message = {
-        "id": message_id,
-        "chat_id": chat_id,
-        "role": message.role,
-        "content": message.content,
-        "created_at": now,
-    }
+    user_message = with_token_count(
+        {
+            "id": message_id,
+            "chat_id": chat_id,
+            "role": message.role,
+            "content": message.content,
+            "created_at": now,
+        }
+    )
 
-    await client.index(settings.MESSAGE_INDEX).add_documents([user_message])
+    write_buffer.add_documents(settings.MESSAGE_INDEX, [user_message])
 
     # Update the chat's updated_at timestamp
-    await client.index(settings.CHAT_INDEX).update_documents(
-        [{"id": chat_id, "updated_at": now}]
+    write_buffer.update_documents(
+        settings.CHAT_INDEX, [{"id": chat_id, "updated_at": now}]
     )
 
-    # Get all previous messages for context
-    messages_result = await client.index(settings.MESSAGE_INDEX).search(
-        filter=f"chat_id = {chat_id}", sort=["created_at:asc"], limit=100
+    # Get the most recent messages for context
+    previous_messages = await get_recent_messages(chat_id)
+
+    # The new message may not be indexed yet
+    if not any(msg["id"] == message_id for msg in previous_messages):
+        previous_messages.append(user_message)
+
+    # Fit the history into the model's token budget
+    messages_for_completion = build_context(
+        chat_id,
+        chat.model,
+        previous_messages,
+        system_prompt=chat.system_prompt,
+        summary=chat.summary,
+        summary_upto=chat.summary_upto,
     )
 
-    # Convert to expected format for the completion API
-    messages_for_completion = [
-        {"role": msg["role"], "content": msg["content"]} for msg in messages_result.hits
-    ]
-
     # Create a completion request
     completion_request = CompletionRequest(
         model=chat.model, messages=messages_for_completion
     )
 
     # Get the model response (non-streaming)
+    start_time = time.time()
     completion = await get_completion(completion_request)
 
     # Extract the response
     assistant_response = completion["choices"][0]["message"]["content"]
 
     # Save the assistant's response
-    assistant_message = {
-        "id": str(uuid.uuid4()),
-        "chat_id": chat_id,
-        "role": "assistant",
-        "content": assistant_response,
-        "created_at": int(time.time()),
-    }
+    assistant_message = with_token_count(
+        {
+            "id": str(uuid.uuid4()),
+            "chat_id": chat_id,
+            "role": "assistant",
+            "content": assistant_response,
+            "created_at": int(time.time()),
+            "metadata": {
+                "model": chat.model,
+                **completion.get("usage", {}),
+                "generation_time": round(time.time() - start_time, 3),
+            },
+        }
+    )
 
-    await client.index(settings.MESSAGE_INDEX).add_documents([assistant_message])
+    write_buffer.add_documents(settings.MESSAGE_INDEX, [assistant_message])
 
     # Check if we should generate a title (after 2 user messages)
     user_messages_count = sum(
-        1 for msg in messages_result.hits if msg["role"] == "user"
+        1 for msg in previous_messages if msg["role"] == "user"
     )
 
     if user_messages_count == 2 and (
         chat.title == "New conversation" or not chat.title
     ):
-        # Generate a title in the background
+        # Generate a title in the background, batched with the other pending titles
         background_tasks.add_task(
-            generate_and_save_title, chat_id, messages_for_completion
+            title_batcher.request, chat_id, messages_for_completion, current_user.id
         )
 
     return ChatResponse(
         id=assistant_message["id"],
         content=assistant_response,
         created_at=assistant_message["created_at"],
+        metadata=assistant_message["metadata"],
     )
 
 
@@ -242,149 +323,38 @@ async def start_message_stream(
     await redis_client.set(
         redis_key,
         json.dumps(session_info),
-        ex=3600,  # 1 hour expiration
+        ex=settings.STREAM_TTL,  # Expires with the generation stream
     )
 
-    async def process(session_id, assistant_message_id):
-        client = await get_meilisearch_client()
-
-        # Verify that the chat exists and belongs to the user
-        chat_result = await client.index(settings.CHAT_INDEX).search(
-            filter=f"id = {chat_id} AND user_id = {current_user.id}", limit=1
-        )
-
-        if not chat_result.hits:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found"
-            )
-
-        chat = Chat(**chat_result.hits[0])
-
-        # Get all previous messages for context
-        messages_result = await client.index(settings.MESSAGE_INDEX).search(
-            filter=f"chat_id = {chat_id}", sort=["created_at:asc"], limit=100
-        )
-
-        # Extract all messages
-        all_messages = messages_result.hits
-
-        # Handle message ID if provided
-        message_id = getattr(message, "id", None)
-        user_message_data = {
-            "id": message_id if message_id else str(uuid.uuid4()),
-            "chat_id": chat_id,
-            "role": message.role,
-            "content": message.content,
-            "created_at": now,
-        }
-
-        # Messages for completion API
-        messages_for_completion = []
-
-        if regenerate:
-            # If regenerating, we need to find all messages before the specified message ID
-            if message_id:
-                # Keep messages that occurred before the specified message
-                filtered_messages = []
-                for msg in all_messages:
-                    if msg["id"] == message_id:
-                        # Include the user message we're regenerating from
-                        filtered_messages.append(msg)
-                        break  # Stop after this message
-                    filtered_messages.append(msg)
-
-                # Convert to expected format for the completion API
-                messages_for_completion = [
-                    {"role": msg["role"], "content": msg["content"]}
-                    for msg in filtered_messages
-                ]
-            else:
-                # If no message ID, just use the current message
-                messages_for_completion = [
-                    {"role": message.role, "content": message.content}
-                ]
-        else:
-            # For a regular message, use all existing messages plus the new one
-            messages_for_completion = [
-                {"role": msg["role"], "content": msg["content"]} for msg in all_messages
-            ]
-
-            # Add the new message to messages_for_completion
-            messages_for_completion.append(
-                {"role": message.role, "content": message.content}
-            )
-
-            # Save the user message to the database
-            await client.index(settings.MESSAGE_INDEX).add_documents(
-                [user_message_data]
-            )
-
-            # Check if we should generate a title (after exactly 2 user messages)
-            # Count user messages (excluding the current one that was just added)
-            user_messages_count = sum(
-                1 for msg in all_messages if msg["role"] == "user"
-            )
-
-            if user_messages_count == 1 and (
-                chat.title == "New conversation" or not chat.title
-            ):
-                # We now have exactly 2 user messages (1 previous + the current one)
-                # Schedule title generation task to run after this message completes
-                background_tasks.add_task(
-                    generate_and_save_title, chat_id, messages_for_completion
-                )
-
-        print("Messages for completion:", messages_for_completion)
-
-        # Update the chat's updated_at timestamp
-        await client.index(settings.CHAT_INDEX).update_documents(
-            [{"id": chat_id, "updated_at": now}]
-        )
-
-        # Create a completion request
-        completion_request = CompletionRequest(
-            model=chat.model,
-            session_id=session_id,
-            messages=messages_for_completion,
-            stream=True,
+    # Verify that the chat exists and belongs to the user
+    if await get_owned(settings.CHAT_INDEX, chat_id, current_user.id, fields=["id"]) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found"
         )
 
-        # Start the streaming generation and get the session ID
-        await start_streaming_completion(completion_request)
+    job = build_generation_job(
+        session_id=session_id,
+        assistant_message_id=assistant_message_id,
+        chat_id=chat_id,
+        user_id=current_user.id,
+        is_admin=current_user.is_admin,
+        message=message.dict(),
+        regenerate=regenerate,
+        created_at=now,
+    )
 
-    background_tasks.add_task(process, session_id, assistant_message_id)
+    # Generation runs in a dedicated worker when the job queue is enabled,
+    # otherwise in this process after the response is sent
+    if settings.GENERATION_QUEUE_ENABLED:
+        await enqueue_generation(job)
+    else:
+        background_tasks.add_task(run_generation, job)
 
     return StreamSession(
         session_id=session_id, message_id=assistant_message_id, created_at=now
     )
 
 
-async def generate_and_save_title(chat_id: str, messages: List[Dict[str, Any]]):
-    """
-    Génère un titre pour la conversation et l'enregistre dans la base de données.
-
-    Args:
-        chat_id: ID de la conversation
-        messages: Liste des messages formatés pour l'API LLM
-    """
-    try:
-        print(f"Generating title for chat {chat_id}...")
-        # Générer le titre
-        title = await generate_chat_title(messages)
-
-        # Mettre à jour le titre dans Meilisearch
-        client = await get_meilisearch_client()
-
-        await client.index(settings.CHAT_INDEX).update_documents(
-            [{"id": chat_id, "title": title, "updated_at": int(time.time())}]
-        )
-
-        print(f"Title updated for chat {chat_id}: {title}")
-
-    except Exception as e:
-        print(f"Error generating title for chat {chat_id}: {e}")
-
-
 @router.get("/stream/{session_id}/events")
 async def stream_chat_events(session_id: str, request: Request):
     """
@@ -392,7 +362,7 @@ async def stream_chat_events(session_id: str, request: Request):
     Authentication is disabled for this route for simplicity.
     """
     # Import redis_client directly
-    from app.services.llm import redis_client, read_stream_messages
+    from app.services.llm import redis_client
 
     # Get session info from Redis
     redis_key = f"session_info:{session_id}"
@@ -416,7 +386,6 @@ async def stream_chat_events(session_id: str, request: Request):
     # Define the SSE streaming response generator
     async def sse_generator():
         full_content = ""
-        client = await get_meilisearch_client()
 
         try:
             # Start reading from the beginning of the stream
@@ -429,14 +398,29 @@ async def stream_chat_events(session_id: str, request: Request):
                 content = event.get("content", "")
                 is_done = event.get("done") == "true" or event_type == "end"
                 error = event.get("error")
+                replace = False
 
-                # For token events, accumulate the content
+                # For token events, accumulate the delta
                 if event_type == "token" and content:
                     full_content += content
 
-                # For end events, use the full_content if available
-                if is_done and "full_content" in event:
-                    full_content = event.get("full_content", full_content)
+                # Snapshots and end events carry the full content: only send
+                # the part this client has not received yet (late joiners)
+                elif event_type == "snapshot" or (is_done and "full_content" in event):
+                    snapshot = event.get("full_content", "")
+                    content = ""
+                    if snapshot.startswith(full_content):
+                        content = snapshot[len(full_content):]
+                        full_content = snapshot
+                    elif snapshot:
+                        # This client missed entries (trimmed from the stream):
+                        # send the whole content for it to replace its own
+                        content = snapshot
+                        replace = True
+                        full_content = snapshot
+
+                    if event_type == "snapshot" and not content:
+                        continue
 
                 # Prepare the event data for the client
                 client_event = {
@@ -447,31 +431,51 @@ async def stream_chat_events(session_id: str, request: Request):
                 if is_done:
                     client_event["id"] = message_id
 
+                if replace:
+                    client_event["replace"] = True
+
+                if event_type == "queued":
+                    client_event["queued"] = int(event.get("position", 0))
+
                 if error:
                     client_event["error"] = error
 
+                cancelled = event.get("status") == "cancelled"
+                if cancelled:
+                    client_event["cancelled"] = True
+
+                # Telemetry of the generation (usage, TTFT, throughput)
+                metadata = json.loads(event["metadata"]) if "metadata" in event else {}
+                if metadata:
+                    client_event["metadata"] = metadata
+
                 # Send the event
                 yield f"data: {json.dumps(client_event)}\n\n"
 
                 # If this is the last event, save the complete message
-                if is_done:
+                # (a cancelled generation saves its partial message itself)
+                if is_done and not cancelled:
                     try:
                         # Save the assistant's message to Meilisearch
-                        assistant_message = {
-                            "id": message_id,
-                            "chat_id": chat_id,
-                            "role": "assistant",
-                            "content": full_content,
-                            "created_at": int(time.time()),
-                        }
-
-                        await client.index(settings.MESSAGE_INDEX).add_documents(
-                            [assistant_message]
+                        assistant_message = with_token_count(
+                            {
+                                "id": message_id,
+                                "chat_id": chat_id,
+                                "role": "assistant",
+                                "content": full_content,
+                                "created_at": int(time.time()),
+                                "metadata": metadata,
+                            }
+                        )
+
+                        write_buffer.add_documents(
+                            settings.MESSAGE_INDEX, [assistant_message]
                         )
-                        print(f"Saved complete message {message_id} to Meilisearch")
+                        print(f"Queued complete message {message_id} for Meilisearch")
                     except Exception as e:
                         print(f"Error saving message to Meilisearch: {e}")
 
+                if is_done:
                     break
 
         except Exception as e:
@@ -490,6 +494,27 @@ async def stream_chat_events(session_id: str, request: Request):
     )
 
 
+@router.post("/stream/{session_id}/cancel")
+async def cancel_stream(
+    session_id: str, current_user: User = Depends(get_current_active_user)
+):
+    """
+    Stop a running generation. The partial response is kept as the
+    assistant message and readers receive a cancelled end event.
+    """
+    from app.services.llm import redis_client
+
+    session_data = await redis_client.get(f"session_info:{session_id}")
+    if not session_data or json.loads(session_data).get("user_id") != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Stream session not found"
+        )
+
+    await request_cancel(session_id)
+
+    return {"message": "Generation cancellation requested"}
+
+
 @router.delete("/{chat_id}")
 async def delete_chat(
     chat_id: str, current_user: User = Depends(get_current_active_user)
@@ -497,11 +522,9 @@ async def delete_chat(
     client = await get_meilisearch_client()
 
     # Verify that the chat exists and belongs to the user
-    chat_result = await client.index(settings.CHAT_INDEX).search(
-        filter=f"id = {chat_id} AND user_id = {current_user.id}", limit=1
-    )
+    chat_data = await get_owned(settings.CHAT_INDEX, chat_id, current_user.id)
 
-    if not chat_result.hits:
+    if chat_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found"
         )
@@ -509,7 +532,7 @@ async def delete_chat(
     # Delete associated messages
 
     messages = await client.index(settings.MESSAGE_INDEX).get_documents(
-        filter=f"chat_id = {chat_id}"
+        filter=f"chat_id = {quote_filter_value(chat_id)}"
     )
     message_ids = [x["id"] for x in messages.results]
     await client.index(settings.MESSAGE_INDEX).delete_documents(message_ids)
@@ -532,11 +555,9 @@ async def update_chat_title(
     client = await get_meilisearch_client()
 
     # Vérifier que le chat existe et appartient à l'utilisateur
-    chat_result = await client.index(settings.CHAT_INDEX).search(
-        filter=f"id = {chat_id} AND user_id = {current_user.id}", limit=1
-    )
+    chat_data = await get_owned(settings.CHAT_INDEX, chat_id, current_user.id)
 
-    if not chat_result.hits:
+    if chat_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found"
         )
@@ -1,22 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Query
+from fastapi.responses import FileResponse, PlainTextResponse
 from typing import List, Optional
 import uuid
 from datetime import datetime
 import os
 import shutil
 import logging
-import aiohttp
 from pypdf import PdfReader
 import docx2txt
 import csv
 import io
-import numpy as np
 import time
 from app.models.user import User
 from app.models.knowledge import (
     Document,
     DocumentCreate,
+    DocumentSummary,
     Vector,
     VectorCreate,
     SearchQuery,
@@ -25,6 +24,9 @@ import requests
 
 from app.services.auth import get_current_active_user
 from app.db.meilisearch import get_meilisearch_client
+from app.db.repository import get_owned, get_many, keyset_page, quote_filter_value
+from app.services.blob_store import store_text, read_text, release_text
+from app.services.embeddings import encode_text
 from app.core.config import settings
 from typing import List
 from langchain_experimental.text_splitter import SemanticChunker
@@ -38,30 +40,6 @@ UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
-# Fonction pour encoder un texte en vecteur (utilisation d'une API externe)
-async def encode_text(texts: str) -> List[float]:
-    """
-    Encode un texte en vecteur en utilisant un modèle d'embeddings.
-    Utilise l'API d'OpenAI pour les embeddings.
-    """
-    api_endpoint = os.getenv("EMBEDDING_API_URL")
-    payload = {
-        "input": texts,
-        "query": False,
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(api_endpoint, json=payload) as response:
-            if response.status != 200:
-                error_detail = await response.text()
-                logger.error(f"Embedding API error: {response.status} - {error_detail}")
-                # Retourner un vecteur aléatoire en cas d'erreur (pour développement uniquement)
-                return list(np.random.rand(1536).astype(float))
-
-            data = await response.json()
-            return data["embeddings"]
-
-
 # Fonction pour découper un texte en chunks
 def chunk_text(text: str) -> List[str]:
     """
@@ -197,6 +175,15 @@ async def extract_text_from_file(file_path: str) -> str:
         )
 
 
+async def count_blob_references(content_hash: str) -> int:
+    """Nombre de documents indexés qui référencent un texte stocké."""
+    client = await get_meilisearch_client()
+    result = await client.index(settings.DOCUMENT_INDEX).search(
+        filter=f"content_hash = {quote_filter_value(content_hash)}", limit=0
+    )
+    return result.estimated_total_hits or 0
+
+
 @router.post("/documents", response_model=Document)
 async def create_document(
     title: str = Form(...),
@@ -238,14 +225,19 @@ async def create_document(
             detail=f"Erreur lors de l'extraction du texte: {str(e)}",
         )
 
-    # Créer le document dans Meilisearch
+    # Stocker le texte intégral hors de l'index (compressé, adressé par contenu)
+    content_hash, content_length = await store_text(text_content, count_blob_references)
+
+    # Créer le document dans Meilisearch (métadonnées et aperçu uniquement)
     client = await get_meilisearch_client()
     now = int(time.time())
 
     document = {
         "id": document_id,
         "title": title,
-        "content": text_content,
+        "preview": text_content[: settings.DOCUMENT_PREVIEW_LENGTH],
+        "content_hash": content_hash,
+        "content_length": content_length,
         "user_id": current_user.id,
         "created_at": now,
         "updated_at": now,
@@ -257,7 +249,12 @@ async def create_document(
         },
     }
 
-    await client.index(settings.DOCUMENT_INDEX).add_documents([document])
+    try:
+        await client.index(settings.DOCUMENT_INDEX).add_documents([document])
+    except Exception:
+        # Le document n'existera pas : il ne référence plus le texte
+        await release_text(content_hash, count_blob_references)
+        raise
 
     # Découper le texte en chunks et les vectoriser
     chunks = chunk_text(text_content)
@@ -273,7 +270,7 @@ async def create_document(
                 "document_id": document_id,
                 "index_name": "documents",
                 "text": chunk,
-                "_vectors": {"qwen": vectors[i]},
+                "_vectors": {settings.EMBEDDER_NAME: vectors[i]},
                 "created_at": now,
                 "metadata": {"chunk_index": i, "document_title": title},
             }
@@ -286,18 +283,29 @@ async def create_document(
     return Document(**document)
 
 
-@router.get("/documents", response_model=List[Document])
-async def list_documents(current_user: User = Depends(get_current_active_user)):
+@router.get("/documents", response_model=List[DocumentSummary])
+async def list_documents(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_active_user),
+):
     """
-    Récupère la liste des documents de l'utilisateur.
+    Récupère la liste paginée des documents de l'utilisateur (sans leur contenu).
+    Le curseur de la page suivante est retourné dans l'en-tête X-Next-Cursor.
     """
-    client = await get_meilisearch_client()
-
-    result = await client.index(settings.DOCUMENT_INDEX).search(
-        filter=f"user_id = {current_user.id}", sort=["created_at:desc"]
+    documents, next_cursor = await keyset_page(
+        settings.DOCUMENT_INDEX,
+        f"user_id = {quote_filter_value(current_user.id)}",
+        limit=limit,
+        cursor=cursor,
+        fields=list(DocumentSummary.model_fields),
     )
 
-    return [Document(**doc) for doc in result.hits]
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return [DocumentSummary(**doc) for doc in documents]
 
 
 @router.get("/documents/{document_id}", response_model=Document)
@@ -307,18 +315,14 @@ async def get_document(
     """
     Récupère les détails d'un document.
     """
-    client = await get_meilisearch_client()
+    document = await get_owned(settings.DOCUMENT_INDEX, document_id, current_user.id)
 
-    result = await client.index(settings.DOCUMENT_INDEX).search(
-        filter=f"id = {document_id} AND user_id = {current_user.id}", limit=1
-    )
-
-    if not result.hits:
+    if document is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
 
-    return Document(**result.hits[0])
+    return Document(**document)
 
 
 @router.delete("/documents/{document_id}")
@@ -328,31 +332,74 @@ async def delete_document(
     """
     Supprime un document et ses vecteurs.
     """
-    client = await get_meilisearch_client()
-
     # Vérifier que le document existe et appartient à l'utilisateur
-    result = await client.index(settings.DOCUMENT_INDEX).search(
-        filter=f"id = {document_id} AND user_id = {current_user.id}", limit=1
-    )
+    document = await get_owned(settings.DOCUMENT_INDEX, document_id, current_user.id)
 
-    if not result.hits:
+    if document is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
 
-    document = result.hits[0]
-
     # Supprimer le fichier associé
     file_path = document.get("metadata", {}).get("file_path")
     if file_path and os.path.exists(file_path):
         os.remove(file_path)
 
     # Supprimer le document
-    await client.index(settings.DOCUMENT_INDEX).delete_document(document_id)
+    client = await get_meilisearch_client()
+    task = await client.index(settings.DOCUMENT_INDEX).delete_document(document_id)
+
+    # Supprimer le texte s'il n'est plus référencé par aucun document
+    content_hash = document.get("content_hash")
+    if content_hash:
+        await client.wait_for_task(task.task_uid)
+        await release_text(content_hash, count_blob_references)
 
     return {"message": "Document deleted successfully"}
 
 
+@router.get("/documents/{document_id}/text", response_class=PlainTextResponse)
+async def get_document_text(
+    document_id: str,
+    offset: int = Query(0, ge=0),
+    length: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Récupère le texte intégral d'un document, ou une plage de celui-ci
+    (offset et length en caractères). La longueur totale est retournée
+    dans l'en-tête X-Content-Length.
+    """
+    document = await get_owned(
+        settings.DOCUMENT_INDEX,
+        document_id,
+        current_user.id,
+        fields=["id", "content_hash", "content_length", "content"],
+    )
+
+    if document is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
+        )
+
+    if document.get("content_hash"):
+        text = await read_text(document["content_hash"], offset, length)
+        if text is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Document text not found"
+            )
+        total_length = document.get("content_length")
+    else:
+        # Documents indexés avant le stockage hors index
+        content = document.get("content") or ""
+        text = content[offset:] if length is None else content[offset : offset + length]
+        total_length = len(content)
+
+    return PlainTextResponse(
+        text, headers={"X-Content-Length": str(total_length)}
+    )
+
+
 @router.post("/search", response_model=List[dict])
 async def search_knowledge(
     query: SearchQuery, current_user: User = Depends(get_current_active_user)
@@ -372,14 +419,18 @@ async def search_knowledge(
 
     search_results = []
 
+    # Récupérer les documents associés en une seule requête
+    documents = await get_many(
+        settings.DOCUMENT_INDEX,
+        [hit["document_id"] for hit in result.hits],
+        fields=["id", "title"],
+    )
+    documents_by_id = {doc["id"]: doc for doc in documents}
+
     for hit in result.hits:
-        # Récupérer les informations du document associé
-        doc_result = await client.index(settings.DOCUMENT_INDEX).search(
-            filter=f"id = {hit['document_id']}", limit=1
-        )
+        doc = documents_by_id.get(hit["document_id"])
 
-        if doc_result.hits:
-            doc = doc_result.hits[0]
+        if doc:
             search_results.append(
                 {
                     "chunk": hit["text_chunk"],
@@ -399,18 +450,13 @@ async def download_document(
     """
     Télécharge le fichier original d'un document.
     """
-    client = await get_meilisearch_client()
-
-    result = await client.index(settings.DOCUMENT_INDEX).search(
-        filter=f"id = {document_id} AND user_id = {current_user.id}", limit=1
-    )
+    document = await get_owned(settings.DOCUMENT_INDEX, document_id, current_user.id)
 
-    if not result.hits:
+    if document is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Document not found"
         )
 
-    document = result.hits[0]
     file_path = document.get("metadata", {}).get("file_path")
 
     if not file_path or not os.path.exists(file_path):
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.models.user import User
+from app.services.auth import get_current_active_user
+from app.core.metrics import metrics
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("")
+async def get_metrics(current_user: User = Depends(get_current_active_user)):
+    """
+    Retourne les métriques internes du worker courant. Réservé aux administrateurs.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
+        )
+
+    return metrics.snapshot()
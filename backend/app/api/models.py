@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
-import aiohttp
 import uuid
 from datetime import datetime
 import time
@@ -8,6 +7,8 @@ from app.models.user import User
 from app.models.models import Model, ModelCreate, ModelUpdate, ModelList
 from app.services.auth import get_current_active_user
 from app.db.meilisearch import get_meilisearch_client
+from app.db.repository import get_by_id
+from app.services.providers import get_provider
 from app.core.config import settings
 
 router = APIRouter(prefix="/models", tags=["models"])
@@ -79,9 +80,9 @@ async def update_model(
     client = await get_meilisearch_client()
     
     # Vérifier que le modèle existe
-    model_result = await client.index("models").search(filter=f"id = {model_id}", limit=1)
+    model = await get_by_id("models", model_id)
     
-    if not model_result.hits:
+    if model is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Model not found"
@@ -99,10 +100,8 @@ async def update_model(
     
     await client.index("models").update_documents([model_update])
     
-    # Récupérer le modèle mis à jour
-    updated_model_result = await client.index("models").search(filter=f"id = {model_id}", limit=1)
-    
-    return Model(**updated_model_result.hits[0])
+    # Le modèle mis à jour est reconstruit en mémoire (l'indexation est asynchrone)
+    return Model(**{**model, **model_update})
 
 @router.delete("/{model_id}")
 async def delete_model(
@@ -122,9 +121,9 @@ async def delete_model(
     client = await get_meilisearch_client()
     
     # Vérifier que le modèle existe
-    model_result = await client.index("models").search(filter=f"id = {model_id}", limit=1)
+    model = await get_by_id("models", model_id)
     
-    if not model_result.hits:
+    if model is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Model not found"
@@ -165,55 +164,13 @@ async def get_openai_models():
     """
     Récupère la liste des modèles disponibles depuis l'API OpenAI.
     """
-    api_base = settings.OPENAI_API_BASE or "https://api.openai.com/v1"
-    api_endpoint = f"{api_base}/models"
-    
-    headers = {
-        "Authorization": f"Bearer {settings.OPENAI_API_KEY}"
-    }
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(api_endpoint, headers=headers) as response:
-            if response.status != 200:
-                return []
-            
-            data = await response.json()
-            models = []
-            
-            for model in data.get("data", []):
-                model_id = model.get("id", "")
-                if "gpt" in model_id.lower():
-                    models.append({
-                        "id": model_id,
-                        "provider": "openai",
-                        "name": model_id
-                    })
-            
-            return models
+    return await get_provider("openai").list_models()
 
 async def get_ollama_models():
     """
     Récupère la liste des modèles disponibles depuis l'API Ollama.
     """
-    api_endpoint = f"{settings.OLLAMA_API_BASE}/api/tags"
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(api_endpoint) as response:
-            if response.status != 200:
-                return []
-            
-            data = await response.json()
-            models = []
-            
-            for model in data.get("models", []):
-                model_name = model.get("name", "")
-                models.append({
-                    "id": model_name,
-                    "provider": "ollama",
-                    "name": model_name
-                })
-            
-            return models
+    return await get_provider("ollama").list_models()
 
 async def initialize_default_models():
     """
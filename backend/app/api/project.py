@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Query
 from fastapi.responses import JSONResponse
 from typing import List, Optional
 import uuid
@@ -17,11 +17,15 @@ from app.models.project import (
 )
 from app.services.auth import get_current_active_user
 from app.db.meilisearch import get_meilisearch_client
+from app.db.repository import get_owned, keyset_page, quote_filter_value
 from app.core.config import settings
 
 
 router = APIRouter(prefix="/project", tags=["project"])
 
+# Champs affichés par la liste des projets
+PROJECT_LIST_FIELDS = ["id", "title", "description", "user_id", "created_at", "updated_at"]
+
 
 @router.post("", response_model=Project)
 async def create_project(
@@ -55,20 +59,28 @@ async def create_project(
 
 
 @router.get("", response_model=List[Project])
-async def list_projects(current_user: User = Depends(get_current_active_user)):
+async def list_projects(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_active_user)
+):
     """
-    Récupère la liste des projets de l'utilisateur.
+    Récupère la liste paginée des projets de l'utilisateur.
+    Le curseur de la page suivante est retourné dans l'en-tête X-Next-Cursor.
     """
-    client = await get_meilisearch_client()
-    
-    result = await client.index("projects").search(
-        "", 
-        filter=f"user_id = {current_user.id}",
-        sort=["created_at:desc"],
-        limit=100
+    projects, next_cursor = await keyset_page(
+        "projects",
+        f"user_id = {quote_filter_value(current_user.id)}",
+        limit=limit,
+        cursor=cursor,
+        fields=PROJECT_LIST_FIELDS,
     )
     
-    return [Project(**project) for project in result.hits]
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return [Project(**project) for project in projects]
 
 
 @router.get("/{project_id}", response_model=ProjectWithFiles)
@@ -81,24 +93,21 @@ async def get_project(
     client = await get_meilisearch_client()
     
     # Récupérer le projet
-    project_result = await client.index("projects").search(
-        "",
-        filter=f"id = {project_id} AND user_id = {current_user.id}",
-        limit=1
-    )
+    project = await get_owned("projects", project_id, current_user.id)
     
-    if not project_result.hits:
+    if project is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
     
-    project = project_result.hits[0]
-    
     # Récupérer les fichiers du projet
     files_result = await client.index("project_files").search(
         "",
-        filter=f"project_id = {project_id} AND user_id = {current_user.id}",
+        filter=(
+            f"project_id = {quote_filter_value(project_id)} "
+            f"AND user_id = {quote_filter_value(current_user.id)}"
+        ),
         limit=100
     )
     
@@ -119,13 +128,9 @@ async def update_project(
     client = await get_meilisearch_client()
     
     # Vérifier que le projet existe et appartient à l'utilisateur
-    project_result = await client.index("projects").search(
-        "",
-        filter=f"id = {project_id} AND user_id = {current_user.id}",
-        limit=1
-    )
+    project = await get_owned("projects", project_id, current_user.id)
     
-    if not project_result.hits:
+    if project is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
@@ -143,14 +148,8 @@ async def update_project(
     
     await client.index("projects").update_documents([project_update])
     
-    # Récupérer le projet mis à jour
-    updated_project_result = await client.index("projects").search(
-        "",
-        filter=f"id = {project_id}",
-        limit=1
-    )
-    
-    return Project(**updated_project_result.hits[0])
+    # Le projet mis à jour est reconstruit en mémoire (l'indexation est asynchrone)
+    return Project(**{**project, **project_update})
 
 
 @router.delete("/{project_id}")
@@ -163,20 +162,18 @@ async def delete_project(
     client = await get_meilisearch_client()
     
     # Vérifier que le projet existe et appartient à l'utilisateur
-    project_result = await client.index("projects").search(
-        "",
-        filter=f"id = {project_id} AND user_id = {current_user.id}",
-        limit=1
-    )
+    project = await get_owned("projects", project_id, current_user.id)
     
-    if not project_result.hits:
+    if project is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
     
     # Supprimer tous les fichiers du projet
-    await client.index("project_files").delete_documents_by_filter(f"project_id = {project_id}")
+    await client.index("project_files").delete_documents_by_filter(
+        f"project_id = {quote_filter_value(project_id)}"
+    )
     
     # Supprimer le projet
     await client.index("projects").delete_document(project_id)
@@ -201,13 +198,9 @@ async def upload_project_file(
     client = await get_meilisearch_client()
     
     # Vérifier que le projet existe et appartient à l'utilisateur
-    project_result = await client.index("projects").search(
-        "",
-        filter=f"id = {project_id} AND user_id = {current_user.id}",
-        limit=1
-    )
+    project = await get_owned("projects", project_id, current_user.id)
     
-    if not project_result.hits:
+    if project is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
@@ -267,20 +260,16 @@ async def delete_project_file(
     client = await get_meilisearch_client()
     
     # Vérifier que le fichier existe et appartient à l'utilisateur
-    file_result = await client.index("project_files").search(
-        "",
-        filter=f"id = {file_id} AND project_id = {project_id} AND user_id = {current_user.id}",
-        limit=1
+    file_info = await get_owned(
+        "project_files", file_id, current_user.id, project_id=project_id
     )
     
-    if not file_result.hits:
+    if file_info is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found"
         )
     
-    file_info = file_result.hits[0]
-    
     # Supprimer le fichier physique
     file_path = Path(settings.UPLOAD_DIR) / "projects" / project_id / file_info["filename"]
     if file_path.exists():
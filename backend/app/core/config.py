@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -8,6 +9,17 @@ class Settings:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
     ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 jours
 
+    # Jetons d'accès autoportants (claims is_active/is_admin) + jetons de rafraîchissement
+    STATELESS_ACCESS_TOKENS = os.getenv("STATELESS_ACCESS_TOKENS", "false").lower() == "true"
+    STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES = int(
+        os.getenv("STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+    )
+    REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+    # Hachage des mots de passe (bcrypt) hors de la boucle d'événements
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
     # CORS
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 
@@ -15,17 +27,123 @@ class Settings:
     MEILISEARCH_URL = os.getenv("MEILISEARCH_URL", "http://localhost:7700")
     MEILISEARCH_API_KEY = os.getenv("MEILISEARCH_API_KEY", "")
 
+    # Écriture différée (regroupement des écritures de documents)
+    WRITE_BUFFER_MAX_BATCH = int(os.getenv("WRITE_BUFFER_MAX_BATCH", "200"))
+    WRITE_BUFFER_FLUSH_INTERVAL_MS = int(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL_MS", "250"))
+
     # Redis for streaming
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+    # Flux de génération (Redis Streams)
+    STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "1000"))
+    STREAM_TTL = int(os.getenv("STREAM_TTL", "3600"))  # secondes
+    STREAM_SNAPSHOT_EVERY_TOKENS = int(os.getenv("STREAM_SNAPSHOT_EVERY_TOKENS", "64"))
+    STREAM_SNAPSHOT_EVERY_BYTES = int(os.getenv("STREAM_SNAPSHOT_EVERY_BYTES", "8192"))
+    # Regroupement des tokens avant écriture (0 pour désactiver)
+    STREAM_COALESCE_MS = int(os.getenv("STREAM_COALESCE_MS", "30"))
+    STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", "256"))
+    # Nettoyage périodique des flux et sessions orphelins
+    STREAM_SWEEP_INTERVAL = int(os.getenv("STREAM_SWEEP_INTERVAL", "300"))  # secondes
+    STREAM_SWEEP_BATCH = int(os.getenv("STREAM_SWEEP_BATCH", "200"))
+    # Flux sans entrée finale ni écriture depuis ce délai : génération abandonnée
+    STREAM_ORPHAN_TIMEOUT = int(os.getenv("STREAM_ORPHAN_TIMEOUT", "900"))  # secondes
+
+    # Cache des utilisateurs authentifiés
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))  # secondes
+    USER_CACHE_CHANNEL = "user_cache:invalidate"
+
+    # Index exact email -> id utilisateur (hash Redis)
+    USER_EMAIL_INDEX_KEY = "users:email_index"
+
     # Google API
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
+
+    # Clients LLM réutilisés (LRU) et préchauffés au démarrage
+    LLM_CLIENT_CACHE_SIZE = int(os.getenv("LLM_CLIENT_CACHE_SIZE", "32"))
+    LLM_DEFAULT_MODELS = [
+        model for model in os.getenv("LLM_DEFAULT_MODELS", "gemini-2.0-flash-lite").split(",") if model
+    ]
+    TITLE_MODEL = os.getenv("TITLE_MODEL", "gemini-2.0-flash-lite")
+    # Titres générés par lots : un appel LLM pour les conversations en attente
+    TITLE_BATCH_MAX = int(os.getenv("TITLE_BATCH_MAX", "16"))
+    TITLE_BATCH_DELAY_MS = int(os.getenv("TITLE_BATCH_DELAY_MS", "500"))
+    # Verrou par conversation : une seule génération de titre pendant ce délai
+    TITLE_LOCK_TTL = int(os.getenv("TITLE_LOCK_TTL", "600"))  # secondes
+
+    # Cache exact des complétions (requêtes identiques et température basse)
+    COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "false").lower() == "true"
+    COMPLETION_CACHE_MAX_TEMPERATURE = float(os.getenv("COMPLETION_CACHE_MAX_TEMPERATURE", "0.3"))
+    COMPLETION_CACHE_TTL = int(os.getenv("COMPLETION_CACHE_TTL", "86400"))  # secondes
+    COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "10000"))
+
+    # Ordonnancement des générations (limites par processus)
+    GENERATION_GLOBAL_LIMIT = int(os.getenv("GENERATION_GLOBAL_LIMIT", "32"))
+    GENERATION_PER_MODEL_LIMIT = int(os.getenv("GENERATION_PER_MODEL_LIMIT", "16"))
+    GENERATION_PER_USER_LIMIT = int(os.getenv("GENERATION_PER_USER_LIMIT", "2"))
+    # Limites spécifiques par modèle, ex. {"gemini-2.5-pro": 4}
+    GENERATION_MODEL_LIMITS = json.loads(os.getenv("GENERATION_MODEL_LIMITS", "{}"))
+    # Poids des administrateurs dans le partage équitable (1.0 = utilisateur standard)
+    GENERATION_ADMIN_WEIGHT = float(os.getenv("GENERATION_ADMIN_WEIGHT", "1.0"))
+    GENERATION_QUEUE_REPORT_INTERVAL = float(os.getenv("GENERATION_QUEUE_REPORT_INTERVAL", "1.0"))  # secondes
+    # Canal pub/sub des demandes d'arrêt de génération
+    GENERATION_CANCEL_CHANNEL = os.getenv("GENERATION_CANCEL_CHANNEL", "generation_cancel")
+
+    # File de jobs de génération consommée par worker.py (sinon génération dans l'API)
+    GENERATION_QUEUE_ENABLED = os.getenv("GENERATION_QUEUE_ENABLED", "false").lower() == "true"
+    GENERATION_JOB_STREAM = os.getenv("GENERATION_JOB_STREAM", "generation_jobs")
+    GENERATION_JOB_GROUP = os.getenv("GENERATION_JOB_GROUP", "generation_workers")
+    GENERATION_JOB_MAXLEN = int(os.getenv("GENERATION_JOB_MAXLEN", "10000"))
+    # Un job non acquitté depuis ce délai (worker arrêté) est repris par un autre worker
+    GENERATION_JOB_CLAIM_IDLE_MS = int(os.getenv("GENERATION_JOB_CLAIM_IDLE_MS", "60000"))
+    GENERATION_JOB_MAX_ATTEMPTS = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "3"))
+    GENERATION_WORKER_CONCURRENCY = int(os.getenv("GENERATION_WORKER_CONCURRENCY", "16"))
+    GENERATION_WORKER_DRAIN_TIMEOUT = float(os.getenv("GENERATION_WORKER_DRAIN_TIMEOUT", "30"))  # secondes
     
-    # Legacy LLM API (kept for backward compatibility)
+    # OpenAI and Ollama APIs
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
     OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "")
     OLLAMA_API_BASE = os.getenv("OLLAMA_API_BASE", "http://localhost:11434")
 
+    # Fournisseurs de modèles : routage d'après le champ provider de l'index des modèles
+    DEFAULT_PROVIDER = os.getenv("DEFAULT_PROVIDER", "gemini")
+    MODEL_ROUTE_CACHE_TTL = int(os.getenv("MODEL_ROUTE_CACHE_TTL", "60"))  # secondes
+    MODEL_ROUTE_CACHE_SIZE = int(os.getenv("MODEL_ROUTE_CACHE_SIZE", "1000"))
+    # Repli sur d'autres modèles si le premier token tarde (ex. {"gemini-2.0-flash": ["gpt-4o-mini"]}),
+    # surchargeable par les champs fallbacks / ttft_deadline_ms des réglages du modèle
+    MODEL_FALLBACKS = json.loads(os.getenv("MODEL_FALLBACKS", "{}"))
+    HEDGE_TTFT_DEADLINE_MS = int(os.getenv("HEDGE_TTFT_DEADLINE_MS", "4000"))
+    # Session HTTP partagée par fournisseur (keep-alive, limite de connexions, cache DNS)
+    PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+    PROVIDER_MAX_CONNECTIONS_PER_HOST = int(os.getenv("PROVIDER_MAX_CONNECTIONS_PER_HOST", "32"))
+    PROVIDER_DNS_CACHE_TTL = int(os.getenv("PROVIDER_DNS_CACHE_TTL", "300"))  # secondes
+    PROVIDER_KEEPALIVE_TIMEOUT = float(os.getenv("PROVIDER_KEEPALIVE_TIMEOUT", "30"))  # secondes
+    PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "10"))  # secondes
+    PROVIDER_READ_TIMEOUT = float(os.getenv("PROVIDER_READ_TIMEOUT", "120"))  # secondes
+    # Fournisseur factice (tests de charge hors ligne) : réponses déterministes,
+    # profil par défaut surchargeable dans le model_id (ex. "fake?ttft_ms=800&error_rate=0.01")
+    FAKE_PROVIDER_ENABLED = os.getenv("FAKE_PROVIDER_ENABLED", "false").lower() == "true"
+    FAKE_PROVIDER_SEED = int(os.getenv("FAKE_PROVIDER_SEED", "0"))
+    FAKE_PROVIDER_TTFT_MS = float(os.getenv("FAKE_PROVIDER_TTFT_MS", "300"))
+    FAKE_PROVIDER_INTER_TOKEN_MS = float(os.getenv("FAKE_PROVIDER_INTER_TOKEN_MS", "20"))
+    # Dispersion log-normale des délais (0 : délais fixes)
+    FAKE_PROVIDER_JITTER = float(os.getenv("FAKE_PROVIDER_JITTER", "0.2"))
+    # Longueur des réponses : loi log-normale de médiane TOKENS et d'écart-type (log) TOKENS_SIGMA
+    FAKE_PROVIDER_TOKENS = int(os.getenv("FAKE_PROVIDER_TOKENS", "200"))
+    FAKE_PROVIDER_TOKENS_SIGMA = float(os.getenv("FAKE_PROVIDER_TOKENS_SIGMA", "0.5"))
+    FAKE_PROVIDER_ERROR_RATE = float(os.getenv("FAKE_PROVIDER_ERROR_RATE", "0"))
+
+    # Cache sémantique des réponses (question proche, même utilisateur, même modèle et même prompt système)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))  # secondes
+    # Suppression périodique des réponses plus anciennes que SEMANTIC_CACHE_TTL (0 : désactivée)
+    SEMANTIC_CACHE_PRUNE_INTERVAL = int(os.getenv("SEMANTIC_CACHE_PRUNE_INTERVAL", "3600"))  # secondes
+
+    # Embeddings (vecteurs fournis à Meilisearch par l'application)
+    EMBEDDER_NAME = os.getenv("EMBEDDER_NAME", "qwen")
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+
     # Meilisearch Indexes
     USER_INDEX = "users"
     CHAT_INDEX = "chats"
@@ -36,8 +154,34 @@ class Settings:
     STREAM_SESSIONS_INDEX = "stream_sessions"
     PROJECT_INDEX = "projects"
     PROJECT_FILE_INDEX = "project_files"
+    RESPONSE_CACHE_INDEX = "response_cache"
     
+    # Pagination des listes (chats, documents, projets)
+    DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+    MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+    # Historique des messages
+    MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+    CONTEXT_MESSAGE_LIMIT = int(os.getenv("CONTEXT_MESSAGE_LIMIT", "100"))
+
+    # Budget de tokens du contexte envoyé au modèle (par défaut et par modèle)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+    CONTEXT_MODEL_BUDGETS = json.loads(os.getenv("CONTEXT_MODEL_BUDGETS", "{}"))
+
+    # Résumé glissant des anciens échanges, mis à jour en arrière-plan
+    SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", TITLE_MODEL)
+    # Résumer quand l'historique non résumé dépasse cette part du budget...
+    SUMMARY_TRIGGER_RATIO = float(os.getenv("SUMMARY_TRIGGER_RATIO", "0.8"))
+    # ... jusqu'à n'en garder que cette part
+    SUMMARY_KEEP_RATIO = float(os.getenv("SUMMARY_KEEP_RATIO", "0.5"))
+    SUMMARY_BATCH_MESSAGES = int(os.getenv("SUMMARY_BATCH_MESSAGES", "20"))
+    SUMMARY_LOCK_TTL = int(os.getenv("SUMMARY_LOCK_TTL", "120"))  # secondes
+
     # Upload directory
     UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 
+    # Texte intégral des documents, compressé et adressé par contenu
+    BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+    DOCUMENT_PREVIEW_LENGTH = int(os.getenv("DOCUMENT_PREVIEW_LENGTH", "500"))
+
 settings = Settings()
\ No newline at end of file
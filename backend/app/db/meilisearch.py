@@ -1,4 +1,7 @@
+import asyncio
 from meilisearch_python_sdk import AsyncClient
+from meilisearch_python_sdk.errors import MeilisearchApiError
+from meilisearch_python_sdk.models.settings import Embedders, UserProvidedEmbedder
 from app.core.config import settings
 
 meilisearch_client = None
@@ -11,6 +14,104 @@ async def get_meilisearch_client() -> AsyncClient:
     return meilisearch_client
 
 
+# Schéma déclaratif des index : attributs filtrables et triables de chacun,
+# et embedders (vecteurs fournis par l'application, par nom -> dimensions)
+INDEX_SCHEMAS = {
+    settings.USER_INDEX: {
+        "filterable": ["id", "username", "email"],
+        "sortable": ["created_at", "updated_at"],
+    },
+    settings.CHAT_INDEX: {
+        "filterable": ["id", "title", "description", "user_id"],
+        "sortable": ["created_at", "updated_at", "id"],
+    },
+    settings.MESSAGE_INDEX: {
+        "filterable": ["id", "content", "chat_id"],
+        "sortable": ["created_at", "updated_at", "id"],
+    },
+    settings.DOCUMENT_INDEX: {
+        "filterable": ["id", "title", "user_id", "content_hash"],
+        "sortable": ["created_at", "updated_at", "id"],
+    },
+    settings.MODEL_INDEX: {
+        "filterable": ["id", "model_id", "provider"],
+        "sortable": ["created_at", "updated_at"],
+    },
+    settings.CHUNK_INDEX: {
+        "filterable": ["id", "document_id", "index_name"],
+        "sortable": ["created_at", "updated_at"],
+    },
+    settings.STREAM_SESSIONS_INDEX: {
+        "filterable": ["id", "user_id"],
+        "sortable": ["created_at", "updated_at"],
+    },
+    settings.PROJECT_INDEX: {
+        "filterable": ["id", "title", "description", "user_id"],
+        "sortable": ["created_at", "updated_at", "id"],
+    },
+    settings.PROJECT_FILE_INDEX: {
+        "filterable": ["id", "project_id", "filename", "file_type", "user_id"],
+        "sortable": ["created_at", "updated_at"],
+    },
+    settings.RESPONSE_CACHE_INDEX: {
+        "filterable": ["id", "scope", "created_at"],
+        "sortable": ["created_at"],
+        "embedders": {settings.EMBEDDER_NAME: settings.EMBEDDING_DIMENSIONS},
+    },
+}
+
+
+def _attribute_names(attributes) -> set:
+    # Les attributs filtrables peuvent être des chaînes ou des objets détaillés
+    names = set()
+    for attribute in attributes or []:
+        if isinstance(attribute, str):
+            names.add(attribute)
+        else:
+            names.update(getattr(attribute, "attribute_patterns", None) or [])
+    return names
+
+
+async def apply_index_schema(client: AsyncClient, index_name: str, schema: dict):
+    """
+    Crée l'index si besoin puis n'envoie que les paramètres qui diffèrent du schéma,
+    pour éviter de relancer une réindexation à chaque démarrage de worker.
+    """
+    try:
+        index = await client.get_index(index_name)
+    except MeilisearchApiError:
+        print(f"create index {index_name}...")
+        index = await client.create_index(index_name, primary_key="id")
+
+    filterable, sortable = await asyncio.gather(
+        index.get_filterable_attributes(), index.get_sortable_attributes()
+    )
+
+    updates = []
+    if _attribute_names(filterable) != set(schema["filterable"]):
+        updates.append(index.update_filterable_attributes(schema["filterable"]))
+    if _attribute_names(sortable) != set(schema["sortable"]):
+        updates.append(index.update_sortable_attributes(schema["sortable"]))
+
+    if schema.get("embedders"):
+        current = await index.get_embedders()
+        if not set(schema["embedders"]) <= set((current and current.embedders) or {}):
+            updates.append(
+                index.update_embedders(
+                    Embedders(
+                        embedders={
+                            name: UserProvidedEmbedder(dimensions=dimensions)
+                            for name, dimensions in schema["embedders"].items()
+                        }
+                    )
+                )
+            )
+
+    if updates:
+        print(f"update settings of index {index_name}...")
+        await asyncio.gather(*updates)
+
+
 async def init_meilisearch():
     print("init meili...")
     global meilisearch_client
@@ -19,95 +120,13 @@ async def init_meilisearch():
         url=settings.MEILISEARCH_URL, api_key=settings.MEILISEARCH_API_KEY
     )
 
-    # Initialiser les index si nécessaire
-    indexes = [
-        settings.USER_INDEX,
-        settings.CHAT_INDEX,
-        settings.MESSAGE_INDEX,
-        settings.DOCUMENT_INDEX,
-        settings.MODEL_INDEX,
-        settings.CHUNK_INDEX,
-        settings.STREAM_SESSIONS_INDEX,
-        settings.PROJECT_INDEX,
-        settings.PROJECT_FILE_INDEX,
-    ]
-
-    for index_name in indexes:
-        print(index_name)
-        try:
-            # Vérifier si l'index existe déjà
-            await meilisearch_client.get_index(index_name)
-
-            # Configurer les paramètres de recherche pour chaque index
-            if index_name == settings.USER_INDEX:
-                print("update user...")
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id", "username", "email"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-            elif index_name == settings.CHAT_INDEX:
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id", "title", "description", "user_id"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-            elif index_name == settings.MESSAGE_INDEX:
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id", "content", "chat_id"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-            elif index_name == settings.DOCUMENT_INDEX:
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id", "title", "content", "user_id"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-            elif index_name == settings.MODEL_INDEX:
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-            elif index_name == settings.STREAM_SESSIONS_INDEX:
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id", "user_id"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-            elif index_name == settings.CHUNK_INDEX:
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id", "document_id", "index_name"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-            elif index_name == settings.PROJECT_INDEX:
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id", "title", "description", "user_id"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-            elif index_name == settings.PROJECT_FILE_INDEX:
-                await meilisearch_client.index(index_name).update_filterable_attributes(
-                    ["id", "project_id", "filename", "file_type", "user_id"]
-                )
-                await meilisearch_client.index(index_name).update_sortable_attributes(
-                    ["created_at", "updated_at"]
-                )
-
-        except Exception:
-            # Créer l'index s'il n'existe pas
-            print("create index...")
-            await meilisearch_client.create_index(index_name, primary_key="id")
+    # Appliquer les schémas de tous les index en parallèle
+    await asyncio.gather(
+        *(
+            apply_index_schema(meilisearch_client, index_name, schema)
+            for index_name, schema in INDEX_SCHEMAS.items()
+        )
+    )
 
 
 async def close_meilisearch():
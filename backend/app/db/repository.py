@@ -0,0 +1,166 @@
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from meilisearch_python_sdk.errors import MeilisearchApiError
+
+from app.db.meilisearch import get_meilisearch_client
+
+
+async def get_by_id(
+    index_name: str, document_id: str, fields: Optional[List[str]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Récupère un document par sa clé primaire (route documents, sans passer
+    par le moteur de recherche). Retourne None s'il n'existe pas.
+    """
+    client = await get_meilisearch_client()
+    try:
+        return await client.index(index_name).get_document(document_id, fields=fields)
+    except MeilisearchApiError as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
+async def get_owned(
+    index_name: str,
+    document_id: str,
+    user_id: str,
+    fields: Optional[List[str]] = None,
+    **expected: Any,
+) -> Optional[Dict[str, Any]]:
+    """
+    Récupère un document par clé primaire et vérifie en mémoire qu'il appartient
+    à l'utilisateur (et, le cas échéant, que les champs de `expected` correspondent).
+    Retourne None si le document n'existe pas ou n'appartient pas à l'utilisateur.
+    """
+    if fields is not None:
+        fields = list({*fields, "user_id", *expected})
+
+    document = await get_by_id(index_name, document_id, fields=fields)
+    if document is None or document.get("user_id") != user_id:
+        return None
+
+    for field, value in expected.items():
+        if document.get(field) != value:
+            return None
+
+    return document
+
+
+async def get_many(
+    index_name: str, ids: List[str], fields: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Récupère plusieurs documents par clé primaire en une seule requête.
+    Les documents absents sont ignorés ; l'ordre de `ids` est conservé.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    if not unique_ids:
+        return []
+
+    client = await get_meilisearch_client()
+    id_list = ", ".join(quote_filter_value(document_id) for document_id in unique_ids)
+    result = await client.index(index_name).get_documents(
+        filter=f"id IN [{id_list}]", limit=len(unique_ids), fields=fields
+    )
+
+    by_id = {document["id"]: document for document in result.results}
+    return [by_id[document_id] for document_id in unique_ids if document_id in by_id]
+
+
+def quote_filter_value(value: str) -> str:
+    """Valeur littérale (entre guillemets, échappée) pour un filtre Meilisearch."""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encode une position de pagination en curseur opaque."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        values = None
+
+    # Position (valeur entière du champ de tri, id)
+    if (
+        not isinstance(values, list)
+        or len(values) != 2
+        or not isinstance(values[0], int)
+        or isinstance(values[0], bool)
+        or not isinstance(values[1], str)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return values
+
+
+async def keyset_page(
+    index_name: str,
+    base_filter: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    sort_field: str = "updated_at",
+    descending: bool = True,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Pagination par clé (keyset) sur (sort_field, id).
+
+    Retourne les documents de la page et le curseur de la page suivante
+    (None s'il n'y en a plus). Le filtre ne porte que sur sort_field ; les
+    égalités sur sort_field sont départagées par id en mémoire.
+    """
+    direction = "desc" if descending else "asc"
+    filters = [base_filter]
+    position = None
+
+    if cursor:
+        position = decode_cursor(cursor)
+        operator = "<=" if descending else ">="
+        filters.append(f"{sort_field} {operator} {int(position[0])}")
+
+    if fields is not None:
+        fields = list({*fields, sort_field, "id"})
+
+    client = await get_meilisearch_client()
+    items: List[Dict[str, Any]] = []
+    offset = 0
+    batch_size = limit + 1
+
+    while True:
+        result = await client.index(index_name).search(
+            "",
+            filter=" AND ".join(f"({f})" for f in filters),
+            sort=[f"{sort_field}:{direction}", f"id:{direction}"],
+            limit=batch_size,
+            offset=offset,
+            attributes_to_retrieve=fields,
+        )
+
+        for hit in result.hits:
+            if position is not None and hit[sort_field] == position[0]:
+                # Même valeur que le curseur : on ne garde que les id au-delà
+                if descending and hit["id"] >= position[1]:
+                    continue
+                if not descending and hit["id"] <= position[1]:
+                    continue
+            items.append(hit)
+
+        if len(items) > limit or len(result.hits) < batch_size:
+            break
+        offset += len(result.hits)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([items[-1][sort_field], items[-1]["id"]])
+
+    return items, next_cursor
@@ -0,0 +1,182 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.meilisearch import get_meilisearch_client
+
+
+class _Segment:
+    """Suite d'écritures consécutives de même nature sur un index."""
+
+    def __init__(self, kind: str):
+        self.kind = kind  # "add" (remplacement) ou "update" (mise à jour partielle)
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.handles: List[asyncio.Future] = []
+        self.durable = False
+
+
+class WriteBehindBuffer:
+    """
+    Tampon d'écriture différée pour Meilisearch.
+
+    Les écritures unitaires sont regroupées par index et envoyées par lots quand
+    le tampon atteint WRITE_BUFFER_MAX_BATCH documents ou après
+    WRITE_BUFFER_FLUSH_INTERVAL_MS. Les mises à jour partielles d'un même
+    document sont fusionnées. Chaque écriture retourne un handle (Future) :
+    il est résolu à l'envoi du lot, ou à la fin de l'indexation si
+    durable=True (lecture de ses propres écritures).
+    """
+
+    def __init__(self, max_batch: int, flush_interval: float):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, List[_Segment]] = defaultdict(list)
+        self._pending_count = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    def add_documents(
+        self, index_name: str, documents: List[Dict[str, Any]], durable: bool = False
+    ) -> asyncio.Future:
+        return self._enqueue("add", index_name, documents, durable)
+
+    def update_documents(
+        self, index_name: str, documents: List[Dict[str, Any]], durable: bool = False
+    ) -> asyncio.Future:
+        return self._enqueue("update", index_name, documents, durable)
+
+    def _enqueue(
+        self, kind: str, index_name: str, documents: List[Dict[str, Any]], durable: bool
+    ) -> asyncio.Future:
+        self.start()
+
+        segments = self._pending[index_name]
+        if not segments or segments[-1].kind != kind:
+            segments.append(_Segment(kind))
+        segment = segments[-1]
+
+        for document in documents:
+            document_id = document["id"]
+            if kind == "update" and document_id in segment.documents:
+                segment.documents[document_id].update(document)
+                metrics.incr("write_buffer.coalesced")
+            else:
+                if document_id in segment.documents:
+                    metrics.incr("write_buffer.coalesced")
+                else:
+                    self._pending_count += 1
+                segment.documents[document_id] = dict(document)
+
+        handle = asyncio.get_running_loop().create_future()
+        # Les appelants qui ignorent le handle ne doivent pas générer d'avertissement
+        handle.add_done_callback(lambda f: f.cancelled() or f.exception())
+        segment.handles.append(handle)
+        segment.durable = segment.durable or durable
+
+        metrics.set_gauge("write_buffer.pending", self._pending_count)
+        if self._pending_count >= self.max_batch:
+            self._wakeup.set()
+
+        return handle
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Une erreur ne doit pas arrêter la tâche de fond
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing write buffer: {e}")
+                metrics.incr("write_buffer.errors")
+
+    async def flush(self):
+        """Envoie immédiatement toutes les écritures en attente."""
+        if not self._pending or self._flush_lock is None:
+            return
+
+        async with self._flush_lock:
+            pending, self._pending = self._pending, defaultdict(list)
+            self._pending_count = 0
+            metrics.set_gauge("write_buffer.pending", 0)
+
+            await asyncio.gather(
+                *(
+                    self._flush_index(index_name, segments)
+                    for index_name, segments in pending.items()
+                )
+            )
+
+    @staticmethod
+    def _fail(segment: _Segment, error: Exception):
+        for handle in segment.handles:
+            if not handle.done():
+                handle.set_exception(error)
+
+    async def _flush_index(self, index_name: str, segments: List[_Segment]):
+        try:
+            client = await get_meilisearch_client()
+            index = client.index(index_name)
+        except Exception as e:
+            # Les écritures sont perdues : leurs handles doivent le signaler
+            print(f"Error flushing write buffer for index {index_name}: {e}")
+            metrics.incr("write_buffer.errors")
+            for segment in segments:
+                self._fail(segment, e)
+            return
+
+        # Les segments d'un même index sont envoyés dans l'ordre d'arrivée
+        for segment in segments:
+            try:
+                documents = list(segment.documents.values())
+                if segment.kind == "add":
+                    task = await index.add_documents(documents)
+                else:
+                    task = await index.update_documents(documents)
+                metrics.incr("write_buffer.batches")
+                metrics.incr("write_buffer.documents", len(documents))
+
+                if segment.durable:
+                    await client.wait_for_task(task.task_uid)
+
+                for handle in segment.handles:
+                    if not handle.done():
+                        handle.set_result(task)
+            except Exception as e:
+                print(f"Error flushing write buffer for index {index_name}: {e}")
+                metrics.incr("write_buffer.errors")
+                self._fail(segment, e)
+
+    async def close(self):
+        """Arrête la tâche de fond et vide le tampon (à appeler à l'arrêt)."""
+        if self._task is not None:
+            # On laisse le flush en cours se terminer plutôt que de l'annuler
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+
+
+write_buffer = WriteBehindBuffer(
+    max_batch=settings.WRITE_BUFFER_MAX_BATCH,
+    flush_interval=settings.WRITE_BUFFER_FLUSH_INTERVAL_MS / 1000,
+)
+
+
+async def close_write_buffer():
+    await write_buffer.close()
@@ -46,6 +46,9 @@ class Chat(ChatBase):
     created_at: int = Field(default_factory=lambda: int(time.time()))
     updated_at: int = Field(default_factory=lambda: int(time.time()))
     system_prompt: Optional[str] = None
+    # Rolling summary of the older messages, and the cursor of the last one it covers
+    summary: Optional[str] = None
+    summary_upto: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -55,6 +58,13 @@ class ChatWithMessages(Chat):
     messages: List[Message] = []
 
 
+class MessagePage(BaseModel):
+    """A window of messages, with the cursors of the adjacent windows"""
+    messages: List[Message]
+    before_cursor: Optional[str] = None  # older messages (None at the start of the chat)
+    after_cursor: Optional[str] = None  # newer messages (None at the latest message)
+
+
 class ChatResponse(BaseModel):
     id: str
     content: str
@@ -14,6 +14,11 @@ class DocumentCreate(DocumentBase):
 class Document(DocumentBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
+    # Le texte intégral est stocké hors index (GET /documents/{id}/text)
+    content: Optional[str] = None
+    preview: Optional[str] = None
+    content_hash: Optional[str] = None
+    content_length: Optional[int] = None
     created_at: int = Field(default_factory=lambda:int(time.time()))
     updated_at: int = Field(default_factory=lambda:int(time.time()))
     metadata: Dict[str, Any] = Field(default_factory=dict)
@@ -21,6 +26,15 @@ class Document(DocumentBase):
     class Config:
         from_attributes = True
         
+class DocumentSummary(BaseModel):
+    """Projection d'un document pour les listes (sans le contenu)"""
+    id: str
+    title: str
+    user_id: str
+    created_at: int
+    updated_at: int
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    
 class VectorBase(BaseModel):
     text_chunk: str
     vector: List[float]
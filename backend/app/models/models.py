@@ -46,6 +46,10 @@ class CompletionRequest(BaseModel):
     max_tokens: Optional[int] = None
     top_p: Optional[float] = 1.0
     stream: Optional[bool] = False
+    # Réutiliser la réponse à une question proche (cache sémantique)
+    semantic_cache: Optional[bool] = False
+    # Utilisateur à qui la réponse est destinée (le cache sémantique n'est pas partagé)
+    user_id: Optional[str] = None
 
 
 class CompletionResponse(BaseModel):
@@ -41,6 +41,11 @@ class UserLogin(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+    
+class RefreshRequest(BaseModel):
+    refresh_token: str
     
 class TokenData(BaseModel):
     user_id: Optional[str] = None
\ No newline at end of file
@@ -4,11 +4,19 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import secrets
 import time
 
 from app.core.config import settings
-from app.models.user import TokenData, User, UserInDB
+from app.core.metrics import metrics
+from app.models.user import TokenData, User, UserInDB, UserUpdate
 from app.db.meilisearch import get_meilisearch_client
+from app.db.redis import get_redis_client
+from app.db.repository import get_by_id, quote_filter_value
+from app.services.user_cache import get_cached_user, cache_user, invalidate_user
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = "votre-secret-key"  # À sécuriser dans les variables d'environnement
@@ -16,28 +24,193 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # par exemple 7 jours
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt bloque ~250 ms par appel : on l'exécute dans un pool dédié et borné
+# pour ne pas figer la boucle d'événements (et les flux SSE) du worker.
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+_hash_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+_hash_waiting = 0
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
 
-async def get_user(email: str):
+async def _run_hashing(func, *args):
+    global _hash_waiting
+    if _hash_waiting >= settings.PASSWORD_HASH_MAX_QUEUE:
+        metrics.incr("password_hash.rejected")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry",
+        )
+
+    queued_at = time.perf_counter()
+    _hash_waiting += 1
+    metrics.set_gauge("password_hash.queue_depth", _hash_waiting)
+    try:
+        await _hash_slots.acquire()
+    finally:
+        _hash_waiting -= 1
+        metrics.set_gauge("password_hash.queue_depth", _hash_waiting)
+
+    try:
+        started_at = time.perf_counter()
+        metrics.observe("password_hash.queue_wait_seconds", started_at - queued_at)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_hash_executor, func, *args)
+        metrics.observe("password_hash.run_seconds", time.perf_counter() - started_at)
+        return result
+    finally:
+        _hash_slots.release()
+
+
+async def verify_password(plain_password, hashed_password):
+    return await _run_hashing(pwd_context.verify, plain_password, hashed_password)
+
+
+async def get_password_hash(password):
+    return await _run_hashing(pwd_context.hash, password)
+
+
+def shutdown_password_hashing():
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+
+# Posé une fois l'index email -> id complet : il fait alors foi à lui seul
+EMAIL_INDEX_REBUILT_KEY = f"{settings.USER_EMAIL_INDEX_KEY}:rebuilt"
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+async def _find_user_id(email: str) -> Optional[str]:
+    """Cherche l'id d'un utilisateur par email dans l'index Meilisearch des utilisateurs."""
+    normalized = normalize_email(email)
     client = await get_meilisearch_client()
-    result = await client.index(settings.USER_INDEX).search(email, attributes_to_search_on=["email"], limit=1)
-    
-    hits = result.hits
-    if not hits:
+    result = await client.index(settings.USER_INDEX).search(
+        "",
+        filter=(
+            f"email = {quote_filter_value(normalized)} "
+            f"OR email = {quote_filter_value(email.strip())}"
+        ),
+        limit=10,
+        attributes_to_retrieve=["id", "email"],
+    )
+    for hit in result.hits:
+        if normalize_email(hit["email"]) == normalized:
+            return hit["id"]
+    return None
+
+
+async def get_user_id_by_email(email: str) -> Optional[str]:
+    """
+    Résout un email en id utilisateur via l'index exact (un seul aller-retour
+    Redis). Tant que l'index n'est pas complet (perdu ou en reconstruction),
+    un email absent est cherché dans Meilisearch et son entrée remise en place.
+    """
+    redis_client = get_redis_client()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hget(settings.USER_EMAIL_INDEX_KEY, normalize_email(email))
+        pipe.exists(EMAIL_INDEX_REBUILT_KEY)
+        user_id, index_complete = await pipe.execute()
+    if user_id is not None:
+        return user_id.decode() if isinstance(user_id, bytes) else user_id
+    if index_complete:
         return None
-    
-    user_data = hits[0]
+
+    user_id = await _find_user_id(email)
+    if user_id is not None:
+        await redis_client.hsetnx(
+            settings.USER_EMAIL_INDEX_KEY, normalize_email(email), user_id
+        )
+        metrics.incr("email_index.backfilled")
+    return user_id
+
+
+async def reserve_email(email: str, user_id: str) -> bool:
+    """
+    Associe atomiquement un email à un id utilisateur.
+    Retourne False si l'email est déjà pris. Tant que l'index n'est pas
+    complet, on vérifie aussi que l'email n'appartient pas à un utilisateur
+    qui en est absent.
+    """
+    redis_client = get_redis_client()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hsetnx(settings.USER_EMAIL_INDEX_KEY, normalize_email(email), user_id)
+        pipe.exists(EMAIL_INDEX_REBUILT_KEY)
+        reserved, index_complete = await pipe.execute()
+    if not reserved:
+        return False
+    if index_complete:
+        return True
+
+    existing_id = await _find_user_id(email)
+    if existing_id is not None and existing_id != user_id:
+        # L'email appartient déjà à un utilisateur : on rétablit son entrée
+        await redis_client.hset(
+            settings.USER_EMAIL_INDEX_KEY, normalize_email(email), existing_id
+        )
+        metrics.incr("email_index.backfilled")
+        return False
+    return True
+
+
+async def release_email(email: str):
+    await get_redis_client().hdel(settings.USER_EMAIL_INDEX_KEY, normalize_email(email))
+
+
+async def rebuild_email_index():
+    """
+    Construit l'index email -> id à partir de l'index Meilisearch des utilisateurs.
+    Ne fait rien si une reconstruction complète a déjà eu lieu (marqueur
+    USER_EMAIL_INDEX_KEY:rebuilt) ; un seul worker s'en charge au démarrage.
+    Pendant la reconstruction, les emails absents sont résolus via Meilisearch.
+    """
+    redis_client = get_redis_client()
+    if await redis_client.exists(EMAIL_INDEX_REBUILT_KEY):
+        return
+
+    lock_key = f"{settings.USER_EMAIL_INDEX_KEY}:rebuild"
+    if not await redis_client.set(lock_key, "1", nx=True, ex=60):
+        return
+
+    try:
+        client = await get_meilisearch_client()
+        offset = 0
+        while True:
+            result = await client.index(settings.USER_INDEX).get_documents(
+                offset=offset, limit=1000, fields=["id", "email"]
+            )
+            if result.results:
+                await redis_client.hset(
+                    settings.USER_EMAIL_INDEX_KEY,
+                    mapping={
+                        normalize_email(user["email"]): user["id"]
+                        for user in result.results
+                    },
+                )
+            offset += len(result.results)
+            if not result.results or offset >= result.total:
+                break
+        await redis_client.set(EMAIL_INDEX_REBUILT_KEY, "1")
+    finally:
+        await redis_client.delete(lock_key)
+
+
+async def get_user(email: str):
+    user_id = await get_user_id_by_email(email)
+    if user_id is None:
+        return None
+
+    user_data = await get_by_id(settings.USER_INDEX, user_id)
+    if user_data is None:
+        return None
+
     return UserInDB(**user_data)
 
 async def authenticate_user(email: str, password: str):
     user = await get_user(email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -54,6 +227,102 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
+
+def create_stateless_access_token(user: User) -> str:
+    """
+    Crée un jeton d'accès de courte durée contenant tout ce qu'il faut pour
+    reconstruire l'utilisateur : sa validation ne nécessite aucune lecture du store.
+    """
+    return create_access_token(
+        data={
+            "sub": str(user.id),
+            "typ": "access",
+            "username": user.username,
+            "email": user.email,
+            "is_active": user.is_active,
+            "is_admin": user.is_admin,
+            "created_at": user.created_at,
+            "updated_at": user.updated_at,
+        },
+        expires_delta=timedelta(minutes=settings.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+
+
+def _refresh_token_key(refresh_token: str) -> str:
+    digest = hashlib.sha256(refresh_token.encode()).hexdigest()
+    return f"refresh_token:{digest}"
+
+
+async def issue_refresh_token(user_id: str) -> str:
+    """Crée un jeton de rafraîchissement révocable stocké dans Redis."""
+    refresh_token = secrets.token_urlsafe(32)
+    key = _refresh_token_key(refresh_token)
+    ttl = settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600
+
+    redis_client = get_redis_client()
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(key, user_id, ex=ttl)
+        pipe.sadd(f"user_refresh_tokens:{user_id}", key)
+        pipe.expire(f"user_refresh_tokens:{user_id}", ttl)
+        await pipe.execute()
+
+    return refresh_token
+
+
+async def consume_refresh_token(refresh_token: str) -> Optional[str]:
+    """
+    Invalide un jeton de rafraîchissement (usage unique) et retourne l'id
+    de son utilisateur, ou None s'il est inconnu, expiré ou révoqué.
+    """
+    key = _refresh_token_key(refresh_token)
+    redis_client = get_redis_client()
+    user_id = await redis_client.getdel(key)
+    if user_id is None:
+        return None
+
+    user_id = user_id.decode() if isinstance(user_id, bytes) else user_id
+    await redis_client.srem(f"user_refresh_tokens:{user_id}", key)
+    return user_id
+
+
+async def revoke_refresh_tokens(user_id: str):
+    """Révoque tous les jetons de rafraîchissement d'un utilisateur."""
+    redis_client = get_redis_client()
+    set_key = f"user_refresh_tokens:{user_id}"
+    keys = await redis_client.smembers(set_key)
+    await redis_client.delete(set_key, *keys)
+
+
+def _user_from_claims(payload: dict) -> Optional[User]:
+    if payload.get("typ") != "access" or "is_active" not in payload:
+        return None
+    try:
+        return User(
+            id=payload["sub"],
+            username=payload["username"],
+            email=payload["email"],
+            is_active=payload["is_active"],
+            is_admin=payload["is_admin"],
+            created_at=payload["created_at"],
+            updated_at=payload["updated_at"],
+        )
+    except (KeyError, ValueError):
+        return None
+
+
+async def get_user_by_id(user_id: str) -> Optional[User]:
+    user = get_cached_user(user_id)
+    if user is not None:
+        return user
+
+    user_data = await get_by_id(settings.USER_INDEX, user_id)
+    if user_data is None:
+        return None
+
+    user = User(**user_data)
+    cache_user(user)
+    return user
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -68,19 +337,64 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = TokenData(user_id=user_id)
     except JWTError:
         raise credentials_exception
-    
-    client = await get_meilisearch_client()
-    result = await client.index(settings.USER_INDEX).search(filter=f"id = '{token_data.user_id}'", limit=1)
-    
-    hits = result.hits
-    if not hits:
+
+    # Jeton autoportant : validation purement CPU, sans lecture du store
+    user = _user_from_claims(payload)
+    if user is not None:
+        return user
+
+    user = await get_user_by_id(token_data.user_id)
+    if user is None:
         raise credentials_exception
-    
-    user_data = hits[0]
-    user = User(**user_data)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+async def update_user(user_id: str, user_update: UserUpdate) -> Optional[User]:
+    """
+    Met à jour un utilisateur et invalide son entrée dans le cache de tous les workers.
+    """
+    client = await get_meilisearch_client()
+    user_data = await get_by_id(settings.USER_INDEX, user_id)
+    if user_data is None:
+        return None
+
+    changes = {
+        field: value
+        for field, value in user_update.model_dump(exclude_unset=True).items()
+        if value is not None
+    }
+    old_email = user_data.get("email")
+    new_email = changes.get("email")
+    email_changed = new_email and normalize_email(new_email) != normalize_email(old_email)
+    if email_changed and not await reserve_email(new_email, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
+        )
+
+    user_data.update(changes)
+    user_data["updated_at"] = int(time.time())
+
+    try:
+        task = await client.index(settings.USER_INDEX).update_documents(
+            [{"id": user_id, **changes, "updated_at": user_data["updated_at"]}]
+        )
+        await client.wait_for_task(task.task_uid)
+    except Exception:
+        # Libérer le nouvel email si la mise à jour a échoué
+        if email_changed:
+            await release_email(new_email)
+        raise
+
+    if email_changed:
+        await release_email(old_email)
+
+    if changes.get("is_active") is False:
+        await revoke_refresh_tokens(user_id)
+
+    await invalidate_user(user_id)
+    return User(**user_data)
@@ -0,0 +1,152 @@
+import asyncio
+import codecs
+import hashlib
+import os
+import tempfile
+import zlib
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.redis import get_redis_client
+
+# Taille des blocs lus sur disque lors d'une lecture partielle
+READ_CHUNK_SIZE = 64 * 1024
+
+# Nombre de documents qui référencent chaque blob. Les écritures et la dernière
+# libération d'un même blob sont sérialisées par un verrou Redis.
+BLOB_REFS_PREFIX = "blob_refs:"
+BLOB_LOCK_PREFIX = "blob_lock:"
+BLOB_LOCK_TTL = 30  # secondes
+
+# Compte les documents indexés qui référencent un blob (blobs antérieurs au compteur)
+ReferenceCounter = Callable[[str], Awaitable[int]]
+
+
+def _blob_path(content_hash: str) -> str:
+    return os.path.join(settings.BLOB_DIR, content_hash[:2], f"{content_hash[2:]}.zz")
+
+
+def _hash_text(text: str) -> Tuple[bytes, str]:
+    data = text.encode("utf-8")
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def _write_blob(data: bytes, content_hash: str):
+    path = _blob_path(content_hash)
+
+    # Adressage par contenu : un texte identique n'est stocké qu'une fois
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(data, level=6))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _read_blob(content_hash: str, offset: int, length: Optional[int]) -> Optional[str]:
+    path = _blob_path(content_hash)
+    if not os.path.exists(path):
+        return None
+
+    # Décompression progressive : on s'arrête dès que la plage demandée est lue
+    decompressor = zlib.decompressobj()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    end = None if length is None else offset + length
+    position = 0
+    parts = []
+
+    with open(path, "rb") as f:
+        while end is None or position < end:
+            compressed = f.read(READ_CHUNK_SIZE)
+            final = not compressed
+            data = decompressor.decompress(compressed) if compressed else decompressor.flush()
+            text = decoder.decode(data, final=final)
+
+            chunk_start = position
+            position += len(text)
+            if position > offset:
+                start = max(offset - chunk_start, 0)
+                stop = None if end is None else end - chunk_start
+                parts.append(text[start:stop])
+
+            if final:
+                break
+
+    return "".join(parts)
+
+
+@asynccontextmanager
+async def _blob_lock(content_hash: str):
+    redis_client = get_redis_client()
+    key = BLOB_LOCK_PREFIX + content_hash
+    while not await redis_client.set(key, "1", nx=True, ex=BLOB_LOCK_TTL):
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        await redis_client.delete(key)
+
+
+async def _ensure_refs(content_hash: str, count_references: ReferenceCounter):
+    # Blob stocké avant le compteur : on l'initialise d'après l'index
+    redis_client = get_redis_client()
+    key = BLOB_REFS_PREFIX + content_hash
+    if os.path.exists(_blob_path(content_hash)) and not await redis_client.exists(key):
+        await redis_client.set(key, await count_references(content_hash), nx=True)
+
+
+async def store_text(text: str, count_references: ReferenceCounter) -> Tuple[str, int]:
+    """
+    Stocke un texte compressé sous UPLOAD_DIR, adressé par son empreinte SHA-256,
+    et compte une référence de plus vers lui. Chaque appel doit être suivi d'un
+    appel à release_text quand le document qui le référence disparaît.
+    Retourne (empreinte, longueur en caractères).
+    """
+    data, content_hash = await asyncio.to_thread(_hash_text, text)
+
+    async with _blob_lock(content_hash):
+        await _ensure_refs(content_hash, count_references)
+        await get_redis_client().incr(BLOB_REFS_PREFIX + content_hash)
+        await asyncio.to_thread(_write_blob, data, content_hash)
+
+    return content_hash, len(text)
+
+
+async def read_text(
+    content_hash: str, offset: int = 0, length: Optional[int] = None
+) -> Optional[str]:
+    """
+    Lit tout ou partie (en caractères) d'un texte stocké.
+    Retourne None si le blob n'existe pas.
+    """
+    return await asyncio.to_thread(_read_blob, content_hash, offset, length)
+
+
+async def release_text(content_hash: str, count_references: ReferenceCounter):
+    """
+    Retire une référence vers un texte stocké et supprime le blob quand plus
+    aucun document ne le référence. `count_references` n'est utilisé que pour
+    les blobs stockés avant le compteur (le document libéré déjà supprimé).
+    """
+    redis_client = get_redis_client()
+    key = BLOB_REFS_PREFIX + content_hash
+
+    async with _blob_lock(content_hash):
+        if await redis_client.exists(key):
+            remaining = await redis_client.decr(key)
+        else:
+            remaining = await count_references(content_hash)
+
+        if remaining <= 0:
+            path = _blob_path(content_hash)
+            if os.path.exists(path):
+                await asyncio.to_thread(os.remove, path)
+            await redis_client.delete(key)
+            metrics.incr("blob_store.deleted")
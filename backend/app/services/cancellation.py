@@ -0,0 +1,100 @@
+import asyncio
+from typing import Awaitable, Dict, Optional
+
+from app.db.redis import get_redis_client
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Generation tasks running in this process, by stream session ID
+_generations: Dict[str, asyncio.Task] = {}
+_listener_task: Optional[asyncio.Task] = None
+
+
+def cancel_key(session_id: str) -> str:
+    return f"stream_cancel:{session_id}"
+
+
+def _cancel_local(session_id: str) -> bool:
+    task = _generations.get(session_id)
+    if task is None or task.done():
+        return False
+    task.cancel()
+    metrics.incr("generation.cancelled")
+    return True
+
+
+async def request_cancel(session_id: str):
+    """
+    Ask the generation of a session to stop, whichever worker runs it.
+
+    The request is recorded in Redis before being broadcast, so a generation
+    that has not registered yet (still queued or loading its context) stops
+    as soon as it does.
+    """
+    redis_client = get_redis_client()
+    await redis_client.set(cancel_key(session_id), "1", ex=settings.STREAM_TTL)
+    if not _cancel_local(session_id):
+        await redis_client.publish(settings.GENERATION_CANCEL_CHANNEL, session_id)
+
+
+async def run_cancellable(session_id: str, generation: Awaitable) -> bool:
+    """
+    Run a generation in its own task so that it can be cancelled through
+    request_cancel. Returns False if it was cancelled.
+    """
+    task = asyncio.ensure_future(generation)
+    _generations[session_id] = task
+    try:
+        if await get_redis_client().exists(cancel_key(session_id)):
+            _cancel_local(session_id)
+        await asyncio.shield(task)
+        return True
+    except asyncio.CancelledError:
+        if not task.done():
+            # The caller itself is being cancelled (e.g. shutdown): wait for
+            # the generation to save its partial answer before propagating
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+            raise
+        return False
+    finally:
+        _generations.pop(session_id, None)
+
+
+async def _listen_cancellations():
+    while True:
+        pubsub = get_redis_client().pubsub()
+        try:
+            await pubsub.subscribe(settings.GENERATION_CANCEL_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = message.get("data")
+                _cancel_local(data.decode() if isinstance(data, bytes) else data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Generation cancellation listener error: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+def start_cancellation_listener():
+    global _listener_task
+    if _listener_task is None:
+        _listener_task = asyncio.create_task(_listen_cancellations())
+
+
+async def stop_cancellation_listener():
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
@@ -0,0 +1,77 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.db.repository import keyset_page, encode_cursor, quote_filter_value
+
+
+def _cursor_of(message: Dict[str, Any]) -> str:
+    return encode_cursor([message["created_at"], message["id"]])
+
+
+async def get_message_window(
+    chat_id: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
+    """
+    Load a window of messages of a chat, in chronological order.
+
+    Without cursor, the newest window is returned. `before` loads the window
+    preceding a cursor and `after` the one following it. Returns the messages
+    and the cursors to pass as `before` / `after` to load the adjacent windows
+    (None when there is nothing further in that direction).
+    """
+    base_filter = f"chat_id = {quote_filter_value(chat_id)}"
+
+    if after:
+        messages, next_cursor = await keyset_page(
+            settings.MESSAGE_INDEX,
+            base_filter,
+            limit=limit,
+            cursor=after,
+            sort_field="created_at",
+            descending=False,
+            fields=fields,
+        )
+        before_cursor = _cursor_of(messages[0]) if messages else after
+        return messages, before_cursor, next_cursor
+
+    messages, next_cursor = await keyset_page(
+        settings.MESSAGE_INDEX,
+        base_filter,
+        limit=limit,
+        cursor=before,
+        sort_field="created_at",
+        descending=True,
+        fields=fields,
+    )
+    messages.reverse()
+
+    after_cursor = None
+    if before:
+        after_cursor = _cursor_of(messages[-1]) if messages else before
+    return messages, next_cursor, after_cursor
+
+
+async def get_recent_messages(
+    chat_id: str, limit: int = None, fields: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """Return the `limit` most recent messages of a chat, oldest first."""
+    messages, _, _ = await get_message_window(
+        chat_id, limit or settings.CONTEXT_MESSAGE_LIMIT, fields=fields
+    )
+    return messages
+
+
+def with_system_prompt(
+    messages: List[Dict[str, Any]], system_prompt: Optional[str]
+) -> List[Dict[str, Any]]:
+    """
+    Make sure the chat's system prompt leads the context, even when the
+    system message fell out of the recent window.
+    """
+    if not system_prompt or any(msg["role"] == "system" for msg in messages):
+        return messages
+    return [{"role": "system", "content": system_prompt}, *messages]
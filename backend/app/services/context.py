@@ -0,0 +1,234 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.db.redis import get_redis_client
+from app.db.repository import (
+    decode_cursor,
+    encode_cursor,
+    get_by_id,
+    keyset_page,
+    quote_filter_value,
+)
+from app.db.write_buffer import write_buffer
+from app.models.models import CompletionRequest
+from app.services.providers import resolve_model
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Token counts are estimated (about 4 characters per token, plus the
+# per-message formatting overhead) and cached on the message documents
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Update the summary with the new messages below. Keep the facts, "
+    "decisions, names, numbers and open questions the assistant will need later; "
+    "drop small talk. Answer with the updated summary only."
+)
+
+# Background summary refreshes, kept referenced until they finish
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    count = message.get("token_count")
+    if count is None:
+        count = estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+        message["token_count"] = count
+    return count
+
+
+def with_token_count(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Set the token count of a message document before it is stored."""
+    message_tokens(message)
+    return message
+
+
+def context_budget(model: str) -> int:
+    return settings.CONTEXT_MODEL_BUDGETS.get(model, settings.CONTEXT_TOKEN_BUDGET)
+
+
+def _position(message: Dict[str, Any]) -> Tuple[int, str]:
+    return (message["created_at"], message["id"])
+
+
+def _cursor_of(message: Dict[str, Any]) -> str:
+    return encode_cursor([message["created_at"], message["id"]])
+
+
+def _is_summarized(message: Dict[str, Any], summary_upto: Optional[str]) -> bool:
+    if not summary_upto or "id" not in message:
+        return False
+    return _position(message) <= tuple(decode_cursor(summary_upto))
+
+
+def _backfill_token_counts(messages: List[Dict[str, Any]]):
+    # Messages stored before token counts existed get theirs once
+    missing = [
+        {"id": msg["id"], "token_count": message_tokens(msg)}
+        for msg in messages
+        if "id" in msg and msg.get("token_count") is None
+    ]
+    if missing:
+        write_buffer.update_documents(settings.MESSAGE_INDEX, missing)
+        metrics.incr("context.token_counts_backfilled", len(missing))
+
+
+def build_context(
+    chat_id: str,
+    model: str,
+    history: List[Dict[str, Any]],
+    system_prompt: Optional[str] = None,
+    summary: Optional[str] = None,
+    summary_upto: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """
+    Assemble the messages sent to the model within the model's token budget.
+
+    `history` is the chronological conversation ending with the message to
+    answer. The context is the system prompt, the rolling summary of the
+    older turns and the most recent turns that fit the remaining budget.
+    When the turns not yet summarized grow past SUMMARY_TRIGGER_RATIO of the
+    budget, the oldest ones are folded into the summary in the background.
+    """
+    _backfill_token_counts(history)
+
+    system_prompts = [msg["content"] for msg in history if msg["role"] == "system"]
+    if system_prompt and system_prompt not in system_prompts:
+        system_prompts.insert(0, system_prompt)
+
+    head = [{"role": "system", "content": content} for content in system_prompts]
+    if summary:
+        head.append(
+            {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}",
+            }
+        )
+
+    budget = context_budget(model)
+    remaining = budget - sum(
+        estimate_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS for msg in head
+    )
+
+    turns = [
+        msg
+        for msg in history
+        if msg["role"] != "system" and not _is_summarized(msg, summary_upto)
+    ]
+
+    # Keep the newest turns that fit (always at least the message to answer)
+    kept: List[Dict[str, Any]] = []
+    for msg in reversed(turns):
+        if kept and message_tokens(msg) > remaining:
+            break
+        kept.append(msg)
+        remaining -= message_tokens(msg)
+    kept.reverse()
+
+    metrics.incr("context.builds")
+    if len(kept) < len(turns):
+        metrics.incr("context.turns_dropped", len(turns) - len(kept))
+
+    unsummarized = sum(message_tokens(msg) for msg in turns)
+    if unsummarized > budget * settings.SUMMARY_TRIGGER_RATIO:
+        # Fold the oldest turns until what is left fits SUMMARY_KEEP_RATIO
+        keep_tokens = 0
+        cutoff = None
+        for msg in reversed(turns):
+            keep_tokens += message_tokens(msg)
+            if keep_tokens > budget * settings.SUMMARY_KEEP_RATIO and "id" in msg:
+                cutoff = msg
+                break
+        if cutoff is not None:
+            schedule_summary_refresh(chat_id, _cursor_of(cutoff))
+
+    return [
+        {"role": msg["role"], "content": msg["content"]} for msg in head + kept
+    ]
+
+
+async def _fold(
+    chat_id: str, summary: Optional[str], messages: List[Dict[str, Any]]
+) -> str:
+    # SUMMARY_MODEL goes through the provider registry like the chat models
+    transcript = "\n\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    request = CompletionRequest(
+        model=settings.SUMMARY_MODEL,
+        session_id=f"summary:{chat_id}",
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {
+                "role": "user",
+                "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}",
+            },
+        ],
+        temperature=0.2,
+    )
+    provider, model_id, _ = await resolve_model(request.model)
+    content = await provider.complete(request, model_id)
+    return content.strip()
+
+
+async def refresh_summary(chat_id: str, cutoff: str):
+    """
+    Fold the messages of a chat up to (and including) `cutoff` into its
+    rolling summary, one page at a time, saving progress after each page.
+    """
+    redis_client = get_redis_client()
+    lock_key = f"summary_lock:{chat_id}"
+    if not await redis_client.set(lock_key, "1", nx=True, ex=settings.SUMMARY_LOCK_TTL):
+        return
+
+    try:
+        # Re-read the chat: another refresh may have moved the summary on
+        chat = await get_by_id(settings.CHAT_INDEX, chat_id, fields=["summary", "summary_upto"])
+        if chat is None:
+            return
+        summary = chat.get("summary")
+        summary_upto = chat.get("summary_upto")
+        cutoff_position = tuple(decode_cursor(cutoff))
+
+        while True:
+            page, _ = await keyset_page(
+                settings.MESSAGE_INDEX,
+                f"chat_id = {quote_filter_value(chat_id)}",
+                limit=settings.SUMMARY_BATCH_MESSAGES,
+                cursor=summary_upto,
+                sort_field="created_at",
+                descending=False,
+                fields=["id", "role", "content", "created_at"],
+            )
+            batch = [msg for msg in page if _position(msg) <= cutoff_position]
+            if not batch:
+                break
+
+            turns = [msg for msg in batch if msg["role"] != "system"]
+            if turns:
+                summary = await _fold(chat_id, summary, turns)
+            summary_upto = _cursor_of(batch[-1])
+
+            await write_buffer.update_documents(
+                settings.CHAT_INDEX,
+                [{"id": chat_id, "summary": summary, "summary_upto": summary_upto}],
+                durable=True,
+            )
+            metrics.incr("context.summary_folds")
+
+            if len(batch) < len(page):
+                break
+    except Exception as e:
+        print(f"Error refreshing summary of chat {chat_id}: {e}")
+    finally:
+        await redis_client.delete(lock_key)
+
+
+def schedule_summary_refresh(chat_id: str, cutoff: str):
+    task = asyncio.create_task(refresh_summary(chat_id, cutoff))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
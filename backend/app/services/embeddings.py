@@ -0,0 +1,76 @@
+import logging
+import os
+from typing import List, Optional, Union
+
+import aiohttp
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Session HTTP partagée par le processus (connexions gardées ouvertes), comme
+# celles des fournisseurs de modèles ; fermée par close_embeddings à l'arrêt
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.PROVIDER_MAX_CONNECTIONS,
+                limit_per_host=settings.PROVIDER_MAX_CONNECTIONS_PER_HOST,
+                ttl_dns_cache=settings.PROVIDER_DNS_CACHE_TTL,
+                keepalive_timeout=settings.PROVIDER_KEEPALIVE_TIMEOUT,
+            ),
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=settings.PROVIDER_CONNECT_TIMEOUT,
+                sock_read=settings.PROVIDER_READ_TIMEOUT,
+            ),
+        )
+    return _session
+
+
+async def close_embeddings():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def request_embeddings(
+    texts: Union[str, List[str]], query: bool = False
+) -> Optional[Union[List[float], List[List[float]]]]:
+    """
+    Appelle le service d'embeddings (EMBEDDING_API_URL).
+    Retourne None si le service répond en erreur.
+    """
+    api_endpoint = os.getenv("EMBEDDING_API_URL")
+    payload = {
+        "input": texts,
+        "query": query,
+    }
+
+    async with _get_session().post(api_endpoint, json=payload) as response:
+        if response.status != 200:
+            error_detail = await response.text()
+            logger.error(f"Embedding API error: {response.status} - {error_detail}")
+            return None
+
+        data = await response.json()
+        return data["embeddings"]
+
+
+# Fonction pour encoder un texte en vecteur (utilisation d'une API externe)
+async def encode_text(texts: str) -> List[float]:
+    """
+    Encode un texte en vecteur en utilisant un modèle d'embeddings.
+    Utilise l'API d'OpenAI pour les embeddings.
+    """
+    embeddings = await request_embeddings(texts)
+    if embeddings is None:
+        # Retourner un vecteur aléatoire en cas d'erreur (pour développement uniquement)
+        return list(np.random.rand(1536).astype(float))
+    return embeddings
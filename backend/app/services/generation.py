@@ -0,0 +1,184 @@
+from typing import Any, Dict
+import time
+import uuid
+
+from app.models.chat import Chat
+from app.models.models import CompletionRequest
+from app.services.llm import start_streaming_completion
+from app.services.scheduler import generation_scheduler
+from app.services.streams import GenerationStreamWriter, write_queued_event
+from app.services.cancellation import run_cancellable
+from app.services.title_generator import title_batcher
+from app.services.chat_history import get_recent_messages
+from app.services.context import build_context, with_token_count
+from app.db.repository import get_owned
+from app.db.write_buffer import write_buffer
+from app.core.config import settings
+
+
+def build_generation_job(
+    session_id: str,
+    assistant_message_id: str,
+    chat_id: str,
+    user_id: str,
+    is_admin: bool,
+    message: Dict[str, Any],
+    regenerate: bool,
+    created_at: int,
+) -> Dict[str, Any]:
+    """Describe a generation so that any worker can run it."""
+    return {
+        "session_id": session_id,
+        "assistant_message_id": assistant_message_id,
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "is_admin": is_admin,
+        "message": message,
+        "regenerate": regenerate,
+        "created_at": created_at,
+    }
+
+
+async def run_generation(job: Dict[str, Any]):
+    """
+    Run a generation job: build the context, wait for a scheduler slot and
+    stream the completion to the session's Redis Stream.
+    """
+    session_id = job["session_id"]
+    assistant_message_id = job["assistant_message_id"]
+    chat_id = job["chat_id"]
+    user_id = job["user_id"]
+    message = job["message"]
+    regenerate = job["regenerate"]
+    now = job["created_at"]
+
+    # Ownership is checked when the job is created, this guards against a
+    # chat deleted in the meantime
+    chat_data = await get_owned(settings.CHAT_INDEX, chat_id, user_id)
+    if chat_data is None:
+        await GenerationStreamWriter(session_id).error("Chat not found")
+        return
+
+    chat = Chat(**chat_data)
+
+    # Get the most recent messages for context
+    all_messages = await get_recent_messages(chat_id)
+
+    # Handle message ID if provided
+    message_id = message.get("id")
+    user_message_data = with_token_count(
+        {
+            "id": message_id if message_id else str(uuid.uuid4()),
+            "chat_id": chat_id,
+            "role": message["role"],
+            "content": message["content"],
+            "created_at": now,
+        }
+    )
+
+    # Conversation leading to the message to answer
+    history = []
+    generate_title = False
+
+    if regenerate:
+        # If regenerating, we need to find all messages before the specified message ID
+        if message_id:
+            # Keep messages that occurred before the specified message
+            for msg in all_messages:
+                history.append(msg)
+                if msg.get("id") == message_id:
+                    # Include the user message we're regenerating from
+                    break  # Stop after this message
+        else:
+            # If no message ID, just use the current message
+            history = [user_message_data]
+    else:
+        # For a regular message, use all existing messages plus the new one
+        history = all_messages + [user_message_data]
+
+        # Save the user message to the database
+        write_buffer.add_documents(settings.MESSAGE_INDEX, [user_message_data])
+
+        # Check if we should generate a title (after exactly 2 user messages)
+        # Count user messages (excluding the current one that was just added)
+        user_messages_count = sum(1 for msg in all_messages if msg["role"] == "user")
+
+        # We now have exactly 2 user messages (1 previous + the current one)
+        generate_title = user_messages_count == 1 and (
+            chat.title == "New conversation" or not chat.title
+        )
+
+    # Fit the history into the model's token budget, older turns being
+    # covered by the chat's rolling summary
+    messages_for_completion = build_context(
+        chat_id,
+        chat.model,
+        history,
+        system_prompt=chat.system_prompt,
+        summary=chat.summary,
+        summary_upto=chat.summary_upto,
+    )
+
+    print("Messages for completion:", messages_for_completion)
+
+    # Update the chat's updated_at timestamp
+    write_buffer.update_documents(
+        settings.CHAT_INDEX, [{"id": chat_id, "updated_at": now}]
+    )
+
+    # Create a completion request
+    completion_request = CompletionRequest(
+        model=chat.model,
+        session_id=session_id,
+        messages=messages_for_completion,
+        stream=True,
+        # A regeneration asks for a new answer
+        semantic_cache=not regenerate,
+        user_id=user_id,
+    )
+
+    async def save_partial_message(content: str, metadata: Dict[str, Any]):
+        # Persisted here rather than by the SSE readers, which may be gone
+        write_buffer.add_documents(
+            settings.MESSAGE_INDEX,
+            [
+                with_token_count(
+                    {
+                        "id": assistant_message_id,
+                        "chat_id": chat_id,
+                        "role": "assistant",
+                        "content": content,
+                        "created_at": int(time.time()),
+                        "metadata": metadata,
+                    }
+                )
+            ],
+        )
+
+    started = False
+
+    async def generate():
+        nonlocal started
+        # Wait for a generation slot (global, per-model and per-user limits),
+        # reporting the queue position to the stream meanwhile
+        weight = settings.GENERATION_ADMIN_WEIGHT if job["is_admin"] else 1.0
+        async with generation_scheduler.slot(
+            user_id,
+            chat.model,
+            weight=weight,
+            on_queued=lambda position: write_queued_event(session_id, position),
+        ) as ticket:
+            started = True
+            await start_streaming_completion(
+                completion_request,
+                on_cancel=save_partial_message,
+                queue_wait=ticket.queue_wait,
+            )
+
+    if not await run_cancellable(session_id, generate()) and not started:
+        # Cancelled before the generation started: close the stream for readers
+        await GenerationStreamWriter(session_id).end(status="cancelled")
+
+    if generate_title:
+        # Generated with the other pending titles, at most once per chat
+        await title_batcher.request(chat_id, messages_for_completion, user_id)
@@ -0,0 +1,213 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+
+from redis.exceptions import ResponseError
+
+from app.db.redis import get_redis_client
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.generation import run_generation
+from app.services.streams import GenerationStreamWriter, stream_key
+
+
+async def enqueue_generation(job: Dict[str, Any]) -> str:
+    """Add a generation job to the queue consumed by the generation workers."""
+    job_id = await get_redis_client().xadd(
+        settings.GENERATION_JOB_STREAM,
+        {"job": json.dumps(job)},
+        maxlen=settings.GENERATION_JOB_MAXLEN,
+        approximate=True,
+    )
+    metrics.incr("generation_jobs.enqueued")
+    return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+
+async def ensure_consumer_group():
+    try:
+        await get_redis_client().xgroup_create(
+            settings.GENERATION_JOB_STREAM,
+            settings.GENERATION_JOB_GROUP,
+            id="0",
+            mkstream=True,
+        )
+    except ResponseError as e:
+        # The group already exists
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+class GenerationWorker:
+    """
+    Consume generation jobs from the Redis stream consumer group and run up
+    to `concurrency` of them at once.
+
+    A job is acknowledged once its generation ends. Jobs left pending by a
+    worker that died are reclaimed after GENERATION_JOB_CLAIM_IDLE_MS; the
+    worker keeps its own running jobs claimed so they are not taken over.
+    """
+
+    def __init__(self, consumer_name: str, concurrency: int):
+        self.consumer_name = consumer_name
+        self.concurrency = concurrency
+        self.redis = get_redis_client()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._stopping = False
+
+    def _free_slots(self) -> int:
+        return self.concurrency - len(self._running)
+
+    async def _ack(self, job_id: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xack(settings.GENERATION_JOB_STREAM, settings.GENERATION_JOB_GROUP, job_id)
+            pipe.xdel(settings.GENERATION_JOB_STREAM, job_id)
+            await pipe.execute()
+
+    async def _run_job(self, job_id: str, job: Dict[str, Any], reclaimed: bool):
+        try:
+            if reclaimed and not await self._can_retry(job_id, job):
+                metrics.incr("generation_jobs.abandoned")
+                return
+            await run_generation(job)
+            metrics.incr("generation_jobs.completed")
+        except Exception as e:
+            print(f"Error running generation job {job_id}: {e}")
+            metrics.incr("generation_jobs.failed")
+            try:
+                writer = await GenerationStreamWriter.resume(job["session_id"])
+                if not writer.finished:
+                    await writer.error(str(e))
+            except Exception as e:
+                print(f"Error reporting generation job failure: {e}")
+        finally:
+            self._running.pop(job_id, None)
+            try:
+                await self._ack(job_id)
+            except Exception as e:
+                print(f"Error acknowledging generation job {job_id}: {e}")
+
+    async def _can_retry(self, job_id: str, job: Dict[str, Any]) -> bool:
+        """
+        A reclaimed job is run again only if its previous attempt produced
+        no output (otherwise readers would see the answer twice) and it has
+        not exhausted its attempts.
+        """
+        pending = await self.redis.xpending_range(
+            settings.GENERATION_JOB_STREAM,
+            settings.GENERATION_JOB_GROUP,
+            min=job_id,
+            max=job_id,
+            count=1,
+        )
+        attempts = pending[0]["times_delivered"] if pending else 1
+        entries = await self.redis.xrevrange(stream_key(job["session_id"]), count=1)
+        has_output = any(
+            fields.get(b"type", b"") not in (b"queued",) for _, fields in entries
+        )
+
+        if has_output or attempts > settings.GENERATION_JOB_MAX_ATTEMPTS:
+            print(f"Abandoning generation job {job_id} after {attempts} attempts")
+            writer = await GenerationStreamWriter.resume(job["session_id"])
+            if not writer.finished:
+                await writer.error("Generation interrupted, please retry")
+            return False
+        return True
+
+    def _start_jobs(self, entries: List[Tuple[Any, Dict]], reclaimed: bool):
+        for job_id, fields in entries:
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            if job_id in self._running:
+                continue
+            if not fields:
+                # Deleted while pending: nothing left to run
+                asyncio.create_task(self._ack(job_id))
+                continue
+            job = json.loads(fields[b"job"])
+            self._running[job_id] = asyncio.create_task(
+                self._run_job(job_id, job, reclaimed)
+            )
+        metrics.set_gauge("generation_jobs.running", len(self._running))
+
+    async def _reclaim(self):
+        result = await self.redis.xautoclaim(
+            settings.GENERATION_JOB_STREAM,
+            settings.GENERATION_JOB_GROUP,
+            self.consumer_name,
+            min_idle_time=settings.GENERATION_JOB_CLAIM_IDLE_MS,
+            count=self._free_slots(),
+        )
+        entries = result[1]
+        if entries:
+            metrics.incr("generation_jobs.reclaimed", len(entries))
+        self._start_jobs(entries, reclaimed=True)
+
+    async def _heartbeat(self):
+        # Reset the idle time of running jobs so other workers leave them alone
+        while not self._stopping:
+            await asyncio.sleep(settings.GENERATION_JOB_CLAIM_IDLE_MS / 3000)
+            if not self._running:
+                continue
+            try:
+                await self.redis.xclaim(
+                    settings.GENERATION_JOB_STREAM,
+                    settings.GENERATION_JOB_GROUP,
+                    self.consumer_name,
+                    min_idle_time=0,
+                    message_ids=list(self._running),
+                    justid=True,
+                )
+            except Exception as e:
+                print(f"Error refreshing generation job claims: {e}")
+
+    async def run(self):
+        await ensure_consumer_group()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        last_reclaim = 0.0
+        loop = asyncio.get_running_loop()
+        print(f"Generation worker {self.consumer_name} started")
+
+        try:
+            while not self._stopping:
+                if self._free_slots() <= 0:
+                    await asyncio.wait(
+                        list(self._running.values()),
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    continue
+
+                try:
+                    if loop.time() - last_reclaim > settings.GENERATION_JOB_CLAIM_IDLE_MS / 1000:
+                        last_reclaim = loop.time()
+                        await self._reclaim()
+                        if self._free_slots() <= 0:
+                            continue
+
+                    items = await self.redis.xreadgroup(
+                        settings.GENERATION_JOB_GROUP,
+                        self.consumer_name,
+                        {settings.GENERATION_JOB_STREAM: ">"},
+                        count=self._free_slots(),
+                        block=1000,
+                    )
+                except Exception as e:
+                    print(f"Error reading generation jobs: {e}")
+                    await asyncio.sleep(1)
+                    continue
+
+                for _, entries in items or []:
+                    self._start_jobs(entries, reclaimed=False)
+        finally:
+            heartbeat.cancel()
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Stop taking jobs and wait for the running ones to finish."""
+        self._stopping = True
+        running: Set[asyncio.Task] = set(self._running.values())
+        if not running:
+            return
+        _, pending = await asyncio.wait(running, timeout=timeout)
+        # Unfinished generations are cancelled: their partial answer is kept
+        for task in pending:
+            task.cancel()
+        # Let them write their cancelled end entry before the clients close
+        await asyncio.gather(*pending, return_exceptions=True)
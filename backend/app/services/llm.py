@@ -1,19 +1,83 @@
-from typing import Dict, Any, AsyncGenerator, List, Optional
-import os
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+from collections import OrderedDict
 import asyncio
+import hashlib
 import json
 import time
 import uuid
-import redis.asyncio as redis
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
 from app.db.redis import get_redis_client
+from app.services.streams import GenerationStreamWriter
+from app.services import semantic_cache
+from app.services.providers import HedgedStream, resolve_model
 
 from app.models.models import CompletionRequest
 from app.core.config import settings
+from app.core.metrics import metrics
 
 redis_client = get_redis_client()
 
+# Registry of warm model clients, keyed by (model, temperature, max_tokens, streaming)
+_chat_models: "OrderedDict[Tuple, ChatGoogleGenerativeAI]" = OrderedDict()
+
+
+def get_chat_model(
+    model: str,
+    temperature: Optional[float] = 0.7,
+    max_tokens: Optional[int] = None,
+    streaming: bool = False,
+) -> ChatGoogleGenerativeAI:
+    """
+    Return a cached model client for these parameters, creating it if needed.
+    Clients keep their transport (and its open connections) between calls;
+    the least recently used ones are dropped beyond LLM_CLIENT_CACHE_SIZE.
+    """
+    key = (model, temperature, max_tokens, streaming)
+    client = _chat_models.get(key)
+    if client is not None:
+        _chat_models.move_to_end(key)
+        metrics.incr("llm_clients.reused")
+        return client
+
+    client = ChatGoogleGenerativeAI(
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        google_api_key=settings.GOOGLE_API_KEY,
+        streaming=streaming,
+    )
+    metrics.incr("llm_clients.created")
+
+    _chat_models[key] = client
+    while len(_chat_models) > settings.LLM_CLIENT_CACHE_SIZE:
+        _chat_models.popitem(last=False)
+        metrics.incr("llm_clients.evicted")
+    metrics.set_gauge("llm_clients.size", len(_chat_models))
+
+    return client
+
+
+def prewarm_chat_models():
+    """Create the clients of the default models at startup."""
+    defaults = CompletionRequest.model_fields
+    for model in settings.LLM_DEFAULT_MODELS:
+        for streaming in (True, False):
+            try:
+                get_chat_model(
+                    model,
+                    temperature=defaults["temperature"].default,
+                    max_tokens=defaults["max_tokens"].default,
+                    streaming=streaming,
+                )
+            except Exception as e:
+                print(f"Error pre-warming model client {model}: {e}")
+
+    try:
+        get_chat_model(settings.TITLE_MODEL, temperature=0.3)
+    except Exception as e:
+        print(f"Error pre-warming title model client: {e}")
+
 
 def convert_messages_to_langchain_format(messages: List[Dict[str, str]]):
     """Convert messages from API format to Langchain format"""
@@ -42,30 +106,207 @@ def convert_messages_to_langchain_format(messages: List[Dict[str, str]]):
     return langchain_messages
 
 
+# Exact-match completion cache: answers stored under completion_cache:<sha256>,
+# with a sorted set of last access times to bound the number of entries
+COMPLETION_CACHE_PREFIX = "completion_cache:"
+COMPLETION_CACHE_LRU_KEY = "completion_cache:lru"
+
+# Size of the chunks a cached answer is replayed in
+CACHE_REPLAY_CHUNK_SIZE = 32
+
+
+def completion_cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+) -> Optional[str]:
+    """
+    Hash of the normalized request, or None if it is not cacheable (cache
+    disabled or temperature above COMPLETION_CACHE_MAX_TEMPERATURE).
+    """
+    if not settings.COMPLETION_CACHE_ENABLED:
+        return None
+    if temperature is None or temperature > settings.COMPLETION_CACHE_MAX_TEMPERATURE:
+        return None
+
+    normalized = {
+        "model": model.strip(),
+        "messages": [
+            {
+                "role": msg["role"].strip().lower(),
+                "content": msg["content"].replace("\r\n", "\n").strip(),
+            }
+            for msg in messages
+        ],
+        "temperature": round(float(temperature), 3),
+        "max_tokens": max_tokens,
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def get_cached_completion(cache_key: Optional[str]) -> Optional[str]:
+    if cache_key is None:
+        return None
+
+    key = COMPLETION_CACHE_PREFIX + cache_key
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.expire(key, settings.COMPLETION_CACHE_TTL)
+            pipe.zadd(COMPLETION_CACHE_LRU_KEY, {cache_key: time.time()}, xx=True)
+            content, _, _ = await pipe.execute()
+    except Exception as e:
+        print(f"Error reading completion cache: {e}")
+        return None
+
+    if content is None:
+        metrics.incr("completion_cache.misses")
+        return None
+
+    metrics.incr("completion_cache.hits")
+    return content.decode("utf-8") if isinstance(content, bytes) else content
+
+
+async def store_completion(cache_key: Optional[str], content: str):
+    """Cache an answer, evicting the least recently used ones beyond the limit."""
+    if cache_key is None or not content:
+        return
+
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(
+                COMPLETION_CACHE_PREFIX + cache_key,
+                content,
+                ex=settings.COMPLETION_CACHE_TTL,
+            )
+            pipe.zadd(COMPLETION_CACHE_LRU_KEY, {cache_key: time.time()})
+            # Entries not used for a whole TTL have already expired
+            pipe.zremrangebyscore(
+                COMPLETION_CACHE_LRU_KEY, "-inf", time.time() - settings.COMPLETION_CACHE_TTL
+            )
+            pipe.zcard(COMPLETION_CACHE_LRU_KEY)
+            size = (await pipe.execute())[-1]
+
+        excess = size - settings.COMPLETION_CACHE_MAX_ENTRIES
+        if excess > 0:
+            evicted = await redis_client.zpopmin(COMPLETION_CACHE_LRU_KEY, excess)
+            if evicted:
+                keys = [k.decode() if isinstance(k, bytes) else k for k, _ in evicted]
+                await redis_client.delete(*[COMPLETION_CACHE_PREFIX + k for k in keys])
+                metrics.incr("completion_cache.evictions", len(evicted))
+        metrics.incr("completion_cache.stores")
+    except Exception as e:
+        print(f"Error writing completion cache: {e}")
+
+
+# Histogram bounds of the per-model generation telemetry
+TOKEN_COUNT_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+
+
+def completion_usage(
+    usage: Dict[str, int], messages: List[Dict[str, str]], content: str
+) -> Dict[str, int]:
+    """
+    Token usage of a completion, as reported by its provider. The counts the
+    provider did not report are estimated from the prompt and the answer.
+    """
+    from app.services.context import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+
+    prompt_tokens = usage.get("prompt_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = sum(
+            estimate_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS for msg in messages
+        )
+    completion_tokens = usage.get("completion_tokens")
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(content) if content else 0
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def generation_metadata(
+    request: CompletionRequest,
+    usage: Dict[str, int],
+    content: str,
+    start_time: float,
+    first_token_time: Optional[float],
+    queue_wait: float,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """Telemetry of a streamed generation, stored on the assistant message."""
+    end_time = time.time()
+    metadata: Dict[str, Any] = {
+        "model": request.model,
+        **completion_usage(usage, request.messages, content),
+        "usage_estimated": (
+            usage.get("prompt_tokens") is None or usage.get("completion_tokens") is None
+        ),
+        "queue_wait": round(queue_wait, 3),
+        "generation_time": round(end_time - start_time, 3),
+        "ttft": None,
+        "tokens_per_second": None,
+        **extra,
+    }
+    if first_token_time is not None:
+        metadata["ttft"] = round(first_token_time - start_time, 3)
+        # Decoding throughput, from the first token to the last one
+        if end_time > first_token_time and metadata["completion_tokens"] > 1:
+            metadata["tokens_per_second"] = round(
+                (metadata["completion_tokens"] - 1) / (end_time - first_token_time), 1
+            )
+    return metadata
+
+
+def record_generation_metrics(metadata: Dict[str, Any], model_name: str):
+    """
+    Add the telemetry of a generation to the per-model histograms, under
+    `model_name` (see providers.metric_model_name).
+    """
+    prefix = f"generation.{model_name}"
+    metrics.incr(f"{prefix}.count")
+    metrics.observe(f"{prefix}.queue_wait_seconds", metadata["queue_wait"])
+    metrics.observe(f"{prefix}.prompt_tokens", metadata["prompt_tokens"], TOKEN_COUNT_BUCKETS)
+    metrics.observe(
+        f"{prefix}.completion_tokens", metadata["completion_tokens"], TOKEN_COUNT_BUCKETS
+    )
+    if metadata["ttft"] is not None:
+        metrics.observe(f"{prefix}.ttft_seconds", metadata["ttft"])
+    if metadata["tokens_per_second"] is not None:
+        metrics.observe(
+            f"{prefix}.tokens_per_second",
+            metadata["tokens_per_second"],
+            TOKENS_PER_SECOND_BUCKETS,
+        )
+
+
 async def get_completion(request: CompletionRequest) -> Dict[str, Any]:
     """
-    Get a completion from the Gemini model using Langchain.
+    Get a completion from the model's provider.
     Returns the full response at once.
     """
-    # Set up the model
-    model = ChatGoogleGenerativeAI(
-        model=request.model,
-        temperature=request.temperature,
-        max_tokens=request.max_tokens,
-        google_api_key=settings.GOOGLE_API_KEY,
+    cache_key = completion_cache_key(
+        request.model, request.messages, request.temperature, request.max_tokens
     )
 
-    # Convert messages to langchain format
-    langchain_messages = convert_messages_to_langchain_format(request.messages)
-
     try:
-        # Get completion
-        result = await model.ainvoke(langchain_messages)
-        content = result.content
+        # Get completion, from the cache when the same request was answered
+        content = await get_cached_completion(cache_key)
+        usage: Dict[str, int] = {}
+        if content is None:
+            provider, model_id, _ = await resolve_model(request.model)
+            content = await provider.complete(request, model_id, usage)
+            await store_completion(cache_key, content)
 
         # Format response to match expected API format
         response = {
-            "id": "gemini-" + model.model,
+            "id": f"{request.model}-{uuid.uuid4()}",
             "object": "chat.completion",
             "created": int(time.time()),
             "model": request.model,
@@ -76,11 +317,7 @@ async def get_completion(request: CompletionRequest) -> Dict[str, Any]:
                     "finish_reason": "stop",
                 }
             ],
-            "usage": {
-                "prompt_tokens": 0,  # We don't have accurate token counts
-                "completion_tokens": 0,
-                "total_tokens": 0,
-            },
+            "usage": completion_usage(usage, request.messages, content),
         }
 
         return response
@@ -88,7 +325,7 @@ async def get_completion(request: CompletionRequest) -> Dict[str, Any]:
         print(f"Error in get_completion: {e}")
         # Return an error response
         return {
-            "id": "gemini-error",
+            "id": f"{request.model}-error",
             "object": "chat.completion",
             "created": int(time.time()),
             "model": request.model,
@@ -106,166 +343,134 @@ async def get_completion(request: CompletionRequest) -> Dict[str, Any]:
         }
 
 
-async def start_streaming_completion(request: CompletionRequest) -> str:
+async def start_streaming_completion(
+    request: CompletionRequest,
+    on_cancel: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None,
+    queue_wait: float = 0.0,
+) -> str:
     """
     Start a streaming completion and return a session ID to track it.
     The actual streaming is handled via Redis Streams.
+
+    The end entry carries the generation's telemetry (token usage, time to
+    first token, throughput and `queue_wait`, the time spent waiting for a
+    scheduler slot) as a JSON `metadata` field.
+
+    If the generation is cancelled, a "cancelled" end entry is written with
+    the partial content, which is also passed to `on_cancel` with the
+    telemetry so far.
     """
     # Generate a unique session ID for this completion
     session_id = request.session_id
 
-    # Set up the model without any callbacks
-    model = ChatGoogleGenerativeAI(
-        model=request.model,
-        temperature=request.temperature,
-        max_tokens=request.max_tokens,
-        google_api_key=settings.GOOGLE_API_KEY,
-        streaming=True,
-    )
-
-    # Convert messages to langchain format
-    langchain_messages = convert_messages_to_langchain_format(request.messages)
-
-    # print(langchain_messages)
-
     # Debug information
     print(f"Starting streaming completion with session_id: {session_id}")
     print(f"Request messages count: {len(request.messages)}")
-    print(f"Langchain messages count: {len(langchain_messages)}")
 
     # Create a timestamp for tracking
     start_time = time.time()
-    full_response = ""
+    first_token_time = None
+    hedged = None
+    writer = GenerationStreamWriter(session_id)
 
-    # Create an initial entry in the stream
-    try:
-        await redis_client.xadd(
-            f"stream:{session_id}",
-            {
-                "type": "start",
-                "content": "",
-                "timestamp": str(start_time),
-                "model": request.model,
-                "done": "false",
-            },
-        )
-    except Exception as e:
-        print(f"Error adding initial entry to Redis Stream: {e}")
+    cache_key = completion_cache_key(
+        request.model, request.messages, request.temperature, request.max_tokens
+    )
 
     # Directly use astream and process each chunk
     try:
-        # Execute the streaming generation directly
-        async for chunk in model.astream(langchain_messages):
-            print("chunk : ", chunk)
-            content = chunk.content
-
-            full_response += content
-
-            # Add token to Redis Stream
+        # Create an initial entry in the stream (a cancellation landing here
+        # still closes the stream with a cancelled end entry)
+        try:
+            await writer.start(request.model)
+        except Exception as e:
+            print(f"Error adding initial entry to Redis Stream: {e}")
+
+        cached_content = await get_cached_completion(cache_key)
+        cached = "true"
+
+        # Then the answer to a similar first question, if the caller allows it
+        semantic_vector = None
+        if cached_content is None and request.semantic_cache:
+            cached_content, semantic_vector = await semantic_cache.lookup(
+                request.model, request.messages, request.user_id
+            )
+            cached = "semantic"
+
+        if cached_content is not None:
+            # Replay the cached answer through the same stream entries
+            first_token_time = time.time()
+            for i in range(0, len(cached_content), CACHE_REPLAY_CHUNK_SIZE):
+                await writer.token(cached_content[i : i + CACHE_REPLAY_CHUNK_SIZE])
+
+            metadata = generation_metadata(
+                request, {}, writer.content, start_time, first_token_time,
+                queue_wait, cached=cached,
+            )
+            await writer.end(
+                total_time=str(time.time() - start_time),
+                cached=cached,
+                metadata=json.dumps(metadata),
+            )
+            return session_id
+
+        # Stream from the model's provider, hedged by its fallbacks
+        hedged = HedgedStream(request)
+        async for delta in hedged.stream():
+            if first_token_time is None:
+                first_token_time = time.time()
+            # Add the token (delta only) to the Redis Stream
             try:
-                await redis_client.xadd(
-                    f"stream:{session_id}",
-                    {
-                        "type": "token",
-                        "content": content,
-                        "full_content": full_response,
-                        "timestamp": str(time.time()),
-                        "done": "false",
-                    },
-                    maxlen=1000,  # Keep at most 1000 entries
-                )
+                await writer.token(delta)
             except Exception as e:
                 print(f"Error adding token to Redis Stream: {e}")
 
+        metadata = generation_metadata(
+            request, hedged.usage, writer.content, start_time, first_token_time,
+            queue_wait, served_by=hedged.served_by,
+        )
+        record_generation_metrics(metadata, hedged.served_by_metric_name)
+
         # Add completion event to Redis when streaming is complete
-        await redis_client.xadd(
-            f"stream:{session_id}",
-            {
-                "type": "end",
-                "content": "",
-                "full_content": full_response,
-                "done": "true",
-                "timestamp": str(time.time()),
-                "total_time": str(time.time() - start_time),
-            },
+        await writer.end(
+            total_time=str(time.time() - start_time),
+            served_by=hedged.served_by,
+            metadata=json.dumps(metadata),
         )
 
-        # Set an expiration on the stream
-        await redis_client.expire(f"stream:{session_id}", 3600)  # 1 hour expiration
+        # The caches are keyed by the requested model: a fallback's answer
+        # must not be served later as that model's
+        if hedged.served_by == request.model:
+            await store_completion(cache_key, writer.content)
+            semantic_cache.store(
+                request.model, request.messages, request.user_id, semantic_vector,
+                writer.content,
+            )
+
+    except asyncio.CancelledError:
+        print(f"Streaming generation cancelled: {session_id}")
+        metadata = generation_metadata(
+            request,
+            hedged.usage if hedged is not None else {},
+            writer.content,
+            start_time,
+            first_token_time,
+            queue_wait,
+            served_by=hedged.served_by if hedged is not None else None,
+            cancelled=True,
+        )
+        await writer.end(
+            status="cancelled",
+            total_time=str(time.time() - start_time),
+            metadata=json.dumps(metadata),
+        )
+        if on_cancel is not None:
+            await on_cancel(writer.content, metadata)
+        raise
 
     except Exception as e:
         print(f"Error in streaming generation: {e}")
         # Send error to Redis on exception
-        await redis_client.xadd(
-            f"stream:{session_id}",
-            {
-                "type": "error",
-                "content": "",
-                "error": str(e),
-                "done": "true",
-                "timestamp": str(time.time()),
-            },
-        )
+        await writer.error(str(e))
 
     return session_id
-
-
-async def read_stream_messages(
-    session_id: str, last_id: str = "0"
-) -> AsyncGenerator[Dict[str, Any], None]:
-    """
-    Read messages from a Redis Stream for a given session ID.
-    Yields events as they become available.
-    """
-    try:
-        stream_key = f"stream:{session_id}"
-        done = False
-
-        while not done:
-            # Read from the stream with a timeout
-            try:
-                items = await redis_client.xread(
-                    streams={stream_key: last_id},
-                    count=10,
-                    block=3000,  # Block for 3 seconds
-                )
-            except Exception as e:
-                print(f"Error reading from Redis Stream: {e}")
-                yield {"error": str(e), "done": "true"}
-                return
-
-            # If we have items, process them
-            if items:
-                for stream_name, messages in items:
-                    for message_id, fields in messages:
-                        # Update last_id for the next iteration
-                        last_id = message_id
-
-                        # Decode the field values from bytes to strings
-                        decoded_fields = {
-                            k.decode(): v.decode() if isinstance(v, bytes) else v
-                            for k, v in fields.items()
-                        }
-
-                        # Prepare the event data
-                        event_data = {"id": message_id.decode(), **decoded_fields}
-
-                        # Check if this is the end message
-                        if (
-                            decoded_fields.get("type") == "end"
-                            or decoded_fields.get("done") == "true"
-                        ):
-                            done = True
-
-                        # Yield the event data
-                        yield event_data
-            else:
-                # Check if the stream exists
-                exists = await redis_client.exists(stream_key)
-                if not exists:
-                    print(f"Stream {stream_key} no longer exists")
-                    yield {"error": "Stream no longer exists", "done": "true"}
-                    return
-    except Exception as e:
-        print(f"Error reading from Redis Stream: {e}")
-        yield {"error": str(e), "done": "true"}
@@ -0,0 +1,605 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import aiohttp
+
+from app.db.meilisearch import get_meilisearch_client
+from app.db.repository import quote_filter_value
+from app.models.models import CompletionRequest
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class ProviderError(Exception):
+    """Error response from a model provider."""
+
+
+Usage = Dict[str, int]
+
+
+class Provider:
+    """
+    Common interface of the model providers: `stream` yields the text deltas
+    of a completion and `complete` returns the whole answer. Both fill the
+    `usage` dict, when given, with the token counts the provider reports
+    ("prompt_tokens" and "completion_tokens").
+    """
+
+    name = ""
+
+    def stream(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> AsyncGenerator[str, None]:
+        raise NotImplementedError
+
+    async def complete(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> str:
+        parts = []
+        async for delta in self.stream(request, model_id, usage):
+            parts.append(delta)
+        return "".join(parts)
+
+    async def close(self):
+        pass
+
+
+class HTTPProvider(Provider):
+    """
+    Provider reached over HTTP through one long-lived aiohttp session per
+    process: connections are kept alive and reused, bounded by
+    PROVIDER_MAX_CONNECTIONS, and DNS answers are cached.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.PROVIDER_MAX_CONNECTIONS,
+                limit_per_host=settings.PROVIDER_MAX_CONNECTIONS_PER_HOST,
+                ttl_dns_cache=settings.PROVIDER_DNS_CACHE_TTL,
+                keepalive_timeout=settings.PROVIDER_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    sock_connect=settings.PROVIDER_CONNECT_TIMEOUT,
+                    sock_read=settings.PROVIDER_READ_TIMEOUT,
+                ),
+            )
+        return self._session
+
+    async def _post(self, url: str, payload: Dict[str, Any], headers=None):
+        response = await self.session().post(url, json=payload, headers=headers)
+        if response.status != 200:
+            error_detail = await response.text()
+            response.release()
+            raise ProviderError(
+                f"{self.name} API error: {response.status} - {error_detail}"
+            )
+        return response
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class GeminiProvider(Provider):
+    """
+    Gemini through the cached langchain clients of app.services.llm, each of
+    which keeps its own transport open between calls.
+    """
+
+    name = "gemini"
+
+    @staticmethod
+    def _add_usage(usage: Optional[Usage], message):
+        # langchain usage metadata adds up over the chunks of a stream
+        metadata = getattr(message, "usage_metadata", None)
+        if usage is None or not metadata:
+            return
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + metadata.get("input_tokens", 0)
+        usage["completion_tokens"] = usage.get("completion_tokens", 0) + metadata.get("output_tokens", 0)
+
+    async def stream(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> AsyncGenerator[str, None]:
+        from app.services.llm import get_chat_model, convert_messages_to_langchain_format
+
+        model = get_chat_model(
+            model_id, request.temperature, request.max_tokens, streaming=True
+        )
+        async for chunk in model.astream(
+            convert_messages_to_langchain_format(request.messages)
+        ):
+            self._add_usage(usage, chunk)
+            if chunk.content:
+                yield chunk.content
+
+    async def complete(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> str:
+        from app.services.llm import get_chat_model, convert_messages_to_langchain_format
+
+        model = get_chat_model(model_id, request.temperature, request.max_tokens)
+        result = await model.ainvoke(
+            convert_messages_to_langchain_format(request.messages)
+        )
+        self._add_usage(usage, result)
+        return result.content
+
+
+class OpenAIProvider(HTTPProvider):
+    """OpenAI-compatible chat completions API."""
+
+    name = "openai"
+
+    def _url(self, path: str) -> str:
+        return f"{settings.OPENAI_API_BASE or 'https://api.openai.com/v1'}{path}"
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
+        }
+
+    def _payload(self, request: CompletionRequest, model_id: str, stream: bool):
+        payload = {
+            "model": model_id,
+            "messages": request.messages,
+            "temperature": request.temperature,
+            "stream": stream,
+        }
+        if stream:
+            # Ask for the token usage in a last chunk
+            payload["stream_options"] = {"include_usage": True}
+        if request.max_tokens:
+            payload["max_tokens"] = request.max_tokens
+        if request.top_p:
+            payload["top_p"] = request.top_p
+        return payload
+
+    @staticmethod
+    def _set_usage(usage: Optional[Usage], data: Dict[str, Any]):
+        reported = data.get("usage")
+        if usage is None or not reported:
+            return
+        usage["prompt_tokens"] = reported.get("prompt_tokens", 0)
+        usage["completion_tokens"] = reported.get("completion_tokens", 0)
+
+    async def stream(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> AsyncGenerator[str, None]:
+        response = await self._post(
+            self._url("/chat/completions"),
+            self._payload(request, model_id, stream=True),
+            headers=self._headers(),
+        )
+        async with response:
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                self._set_usage(usage, chunk)
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+
+    async def complete(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> str:
+        response = await self._post(
+            self._url("/chat/completions"),
+            self._payload(request, model_id, stream=False),
+            headers=self._headers(),
+        )
+        async with response:
+            data = await response.json()
+        self._set_usage(usage, data)
+        return data["choices"][0]["message"]["content"]
+
+    async def list_models(self) -> List[Dict[str, str]]:
+        async with self.session().get(
+            self._url("/models"), headers=self._headers()
+        ) as response:
+            if response.status != 200:
+                return []
+            data = await response.json()
+
+        return [
+            {"id": model["id"], "provider": "openai", "name": model["id"]}
+            for model in data.get("data", [])
+            if "gpt" in model.get("id", "").lower()
+        ]
+
+
+class OllamaProvider(HTTPProvider):
+    """Ollama chat API (newline-delimited JSON when streaming)."""
+
+    name = "ollama"
+
+    def _payload(self, request: CompletionRequest, model_id: str, stream: bool):
+        payload = {
+            "model": model_id,
+            "messages": request.messages,
+            "stream": stream,
+            "options": {
+                "temperature": request.temperature,
+            },
+        }
+        if request.max_tokens:
+            payload["options"]["num_predict"] = request.max_tokens
+        if request.top_p:
+            payload["options"]["top_p"] = request.top_p
+        return payload
+
+    @staticmethod
+    def _set_usage(usage: Optional[Usage], data: Dict[str, Any]):
+        # Counts of the prompt evaluation and of the generated tokens
+        if usage is None or "eval_count" not in data:
+            return
+        usage["prompt_tokens"] = data.get("prompt_eval_count", 0)
+        usage["completion_tokens"] = data["eval_count"]
+
+    async def stream(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> AsyncGenerator[str, None]:
+        response = await self._post(
+            f"{settings.OLLAMA_API_BASE}/api/chat",
+            self._payload(request, model_id, stream=True),
+        )
+        async with response:
+            async for line in response.content:
+                try:
+                    chunk = json.loads(line.decode("utf-8").strip())
+                except json.JSONDecodeError:
+                    continue
+                content = chunk.get("message", {}).get("content", "")
+                if content:
+                    yield content
+                if chunk.get("done", False):
+                    self._set_usage(usage, chunk)
+                    break
+
+    async def complete(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> str:
+        response = await self._post(
+            f"{settings.OLLAMA_API_BASE}/api/chat",
+            self._payload(request, model_id, stream=False),
+        )
+        async with response:
+            data = await response.json()
+        self._set_usage(usage, data)
+        return data.get("message", {}).get("content", "")
+
+    async def list_models(self) -> List[Dict[str, str]]:
+        async with self.session().get(f"{settings.OLLAMA_API_BASE}/api/tags") as response:
+            if response.status != 200:
+                return []
+            data = await response.json()
+
+        return [
+            {"id": model["name"], "provider": "ollama", "name": model["name"]}
+            for model in data.get("models", [])
+        ]
+
+
+class FakeProvider(Provider):
+    """
+    Local provider for load and latency tests, enabled by
+    FAKE_PROVIDER_ENABLED. Answers are words drawn from a generator seeded
+    with FAKE_PROVIDER_SEED, the model id and the messages: the same
+    request always gets the same tokens, delays and failures.
+
+    The profile defaults to the FAKE_PROVIDER_* settings and can be set per
+    model in the query string of its model_id, e.g. the models index entry
+    {"model_id": "fake?ttft_ms=900&inter_token_ms=35&error_rate=0.02",
+    "provider": "fake"}. Delays vary around ttft_ms and inter_token_ms with
+    a log-normal jitter; the answer length is log-normal with median
+    `tokens` (capped by max_tokens). A failing request raises a
+    ProviderError after a random number of tokens, possibly none.
+    """
+
+    name = "fake"
+
+    WORDS = (
+        "the", "model", "stream", "token", "answer", "request", "latency",
+        "queue", "worker", "cache", "context", "summary", "provider", "load",
+        "test", "of", "and", "to", "with", "for", "a", "is", "on", "in",
+    )
+
+    @staticmethod
+    def _profile(model_id: str) -> Dict[str, float]:
+        profile = {
+            "ttft_ms": settings.FAKE_PROVIDER_TTFT_MS,
+            "inter_token_ms": settings.FAKE_PROVIDER_INTER_TOKEN_MS,
+            "jitter": settings.FAKE_PROVIDER_JITTER,
+            "tokens": settings.FAKE_PROVIDER_TOKENS,
+            "tokens_sigma": settings.FAKE_PROVIDER_TOKENS_SIGMA,
+            "error_rate": settings.FAKE_PROVIDER_ERROR_RATE,
+        }
+        for key, value in parse_qsl(model_id.partition("?")[2]):
+            if key in profile:
+                profile[key] = float(value)
+        return profile
+
+    @staticmethod
+    def _delay(rng: random.Random, ms: float, jitter: float) -> float:
+        return ms / 1000 * rng.lognormvariate(0, jitter)
+
+    async def stream(
+        self, request: CompletionRequest, model_id: str, usage: Optional[Usage] = None
+    ) -> AsyncGenerator[str, None]:
+        from app.services.context import estimate_tokens
+
+        profile = self._profile(model_id)
+        seed = hashlib.sha256(
+            json.dumps([settings.FAKE_PROVIDER_SEED, model_id, request.messages]).encode()
+        ).digest()
+        rng = random.Random(seed)
+
+        length = max(
+            1,
+            round(
+                rng.lognormvariate(
+                    math.log(max(profile["tokens"], 1)), profile["tokens_sigma"]
+                )
+            ),
+        )
+        if request.max_tokens:
+            length = min(length, request.max_tokens)
+        fail_at = rng.randrange(length) if rng.random() < profile["error_rate"] else None
+
+        await asyncio.sleep(self._delay(rng, profile["ttft_ms"], profile["jitter"]))
+        for i in range(length):
+            if i == fail_at:
+                raise ProviderError(f"{self.name} API error: injected failure")
+            if i:
+                await asyncio.sleep(
+                    self._delay(rng, profile["inter_token_ms"], profile["jitter"])
+                )
+            word = rng.choice(self.WORDS)
+            yield f" {word}" if i else word.capitalize()
+
+        if usage is not None:
+            usage["prompt_tokens"] = sum(
+                estimate_tokens(msg["content"]) for msg in request.messages
+            )
+            usage["completion_tokens"] = length
+
+
+_providers: Dict[str, Provider] = {
+    provider.name: provider
+    for provider in (GeminiProvider(), OpenAIProvider(), OllamaProvider())
+}
+if settings.FAKE_PROVIDER_ENABLED:
+    _providers[FakeProvider.name] = FakeProvider()
+
+# Routes of the models seen recently (LRU + TTL): model -> (expires_at, provider, model_id, model)
+_routes: "OrderedDict[str, Tuple[float, str, str, Dict[str, Any]]]" = OrderedDict()
+
+
+def get_provider(name: str) -> Provider:
+    provider = _providers.get(name)
+    if provider is None:
+        raise ProviderError(f"Unknown model provider: {name}")
+    return provider
+
+
+def _guess_provider(model: str) -> str:
+    # Models missing from the registry keep the historical behaviour
+    if model.startswith("gpt-"):
+        return "openai"
+    if settings.FAKE_PROVIDER_ENABLED and model.startswith("fake"):
+        return "fake"
+    return settings.DEFAULT_PROVIDER
+
+
+async def resolve_model(model: str) -> Tuple[Provider, str, Dict[str, Any]]:
+    """
+    Find the provider of a model from its entry in the models index (looked
+    up by model_id, the MODEL_ROUTE_CACHE_SIZE most recent ones cached for
+    MODEL_ROUTE_CACHE_TTL seconds). Returns the provider, the model name to
+    send to it and the model document.
+    """
+    route = _routes.get(model)
+    if route is not None and route[0] >= time.monotonic():
+        _routes.move_to_end(model)
+    else:
+        document: Dict[str, Any] = {}
+        try:
+            client = await get_meilisearch_client()
+            result = await client.index(settings.MODEL_INDEX).search(
+                filter=f"model_id = {quote_filter_value(model)}", limit=1
+            )
+            if result.hits:
+                document = result.hits[0]
+        except Exception as e:
+            print(f"Error resolving model {model}: {e}")
+
+        route = (
+            time.monotonic() + settings.MODEL_ROUTE_CACHE_TTL,
+            document.get("provider") or _guess_provider(model),
+            document.get("model_id") or model,
+            document,
+        )
+        _routes[model] = route
+        _routes.move_to_end(model)
+        while len(_routes) > settings.MODEL_ROUTE_CACHE_SIZE:
+            _routes.popitem(last=False)
+
+    _, provider_name, model_id, document = route
+    metrics.incr(f"provider.{provider_name}.requests")
+    return get_provider(provider_name), model_id, document
+
+
+def metric_model_name(model: str, document: Dict[str, Any]) -> str:
+    """
+    Name of a model in metric names: requested model names are free-form, so
+    those missing from the models index share the `other` bucket.
+    """
+    return model if document else "other"
+
+
+class HedgedStream:
+    """
+    Stream a completion from a model, hedged by its fallback chain.
+
+    The chain is the model followed by its fallbacks (the `fallbacks` list
+    of the model settings, else MODEL_FALLBACKS). If the current candidate
+    has not produced its first token within the TTFT deadline
+    (`ttft_deadline_ms` of the model settings, else HEDGE_TTFT_DEADLINE_MS),
+    or fails before it, the next one is started alongside. The first
+    candidate to produce a token serves the whole answer and the others are
+    cancelled. Errors after the first token are not retried.
+    """
+
+    def __init__(self, request: CompletionRequest):
+        self.request = request
+        # Model that served the answer, and the token usage its provider reported
+        self.served_by: Optional[str] = None
+        self.usage: Usage = {}
+        # Names of the requested and serving models in metric names
+        self.metric_name = "other"
+        self.served_by_metric_name = "other"
+
+    async def _chain(self) -> Tuple[List[Tuple[str, Provider, str, str]], float]:
+        provider, model_id, document = await resolve_model(self.request.model)
+        model_settings = document.get("settings") or {}
+        self.metric_name = metric_model_name(self.request.model, document)
+
+        fallbacks = model_settings.get("fallbacks")
+        if fallbacks is None:
+            fallbacks = settings.MODEL_FALLBACKS.get(self.request.model, [])
+
+        chain = [(self.request.model, provider, model_id, self.metric_name)]
+        for fallback in fallbacks:
+            if fallback == self.request.model:
+                continue
+            # A misconfigured fallback must not fail the request
+            try:
+                fallback_provider, fallback_id, fallback_document = await resolve_model(fallback)
+            except ProviderError as e:
+                print(f"Skipping fallback {fallback} of {self.request.model}: {e}")
+                continue
+            chain.append(
+                (
+                    fallback,
+                    fallback_provider,
+                    fallback_id,
+                    metric_model_name(fallback, fallback_document),
+                )
+            )
+
+        deadline_ms = model_settings.get("ttft_deadline_ms", settings.HEDGE_TTFT_DEADLINE_MS)
+        return chain, deadline_ms / 1000
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        chain, deadline = await self._chain()
+        loop = asyncio.get_running_loop()
+
+        # Candidates waiting for their first token: task -> (index, generator)
+        pending: Dict[asyncio.Future, Tuple[int, AsyncGenerator[str, None]]] = {}
+        usages: List[Usage] = []
+        launched = 0
+        last_launch = 0.0
+        last_error: Optional[BaseException] = None
+        winner = None
+
+        def launch():
+            nonlocal launched, last_launch
+            name, provider, model_id, _ = chain[launched]
+            usages.append({})
+            generator = provider.stream(self.request, model_id, usages[launched])
+            pending[asyncio.ensure_future(generator.__anext__())] = (launched, generator)
+            if launched > 0:
+                metrics.incr("hedge.backups_started")
+                metrics.incr(f"hedge.{self.metric_name}.backups_started")
+            launched += 1
+            last_launch = loop.time()
+
+        metrics.incr("hedge.requests")
+        metrics.incr(f"hedge.{self.metric_name}.requests")
+        launch()
+
+        try:
+            while winner is None:
+                if not pending:
+                    raise last_error or ProviderError("No provider produced an answer")
+
+                timeout = None
+                if launched < len(chain):
+                    timeout = max(last_launch + deadline - loop.time(), 0)
+
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # TTFT deadline missed: start the next candidate alongside
+                    launch()
+                    continue
+
+                for task in done:
+                    index, generator = pending.pop(task)
+                    error = task.exception()
+                    if winner is None and (
+                        error is None or isinstance(error, StopAsyncIteration)
+                    ):
+                        first = None if error else task.result()
+                        winner = (index, generator, first)
+                        continue
+
+                    await generator.aclose()
+                    if error is not None and not isinstance(error, StopAsyncIteration):
+                        print(f"Provider for {chain[index][0]} failed: {error}")
+                        last_error = error
+                        metrics.incr("hedge.failures")
+                        if launched < len(chain):
+                            launch()
+        finally:
+            # Cancel the candidates that lost (or all of them on error)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for _, generator in pending.values():
+                await generator.aclose()
+
+        index, generator, first = winner
+        self.served_by = chain[index][0]
+        self.served_by_metric_name = chain[index][3]
+        self.usage = usages[index]
+        metrics.incr("hedge.primary_wins" if index == 0 else "hedge.backup_wins")
+
+        try:
+            if first is None:
+                return
+            yield first
+            async for delta in generator:
+                yield delta
+        finally:
+            await generator.aclose()
+
+
+async def close_providers():
+    for provider in _providers.values():
+        await provider.close()
@@ -0,0 +1,182 @@
+import asyncio
+import itertools
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class GenerationTicket:
+    """A granted (or pending) generation slot."""
+
+    def __init__(
+        self, user_id: str, model: str, start_tag: float, finish_tag: float, order: int
+    ):
+        self.user_id = user_id
+        self.model = model
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.order = order
+        self.enqueued_at = time.monotonic()
+        self.queue_wait = 0.0
+        self.granted = asyncio.get_running_loop().create_future()
+
+
+class GenerationScheduler:
+    """
+    Limit concurrent generations globally, per model and per user, and share
+    the capacity between users with weighted fair queuing: each request gets
+    a virtual finish tag (start + 1 / weight) and waiting requests are
+    started in tag order, skipping those whose model or user is at its limit.
+    Limits apply to the current process.
+    """
+
+    def __init__(
+        self,
+        global_limit: int,
+        per_model_limit: int,
+        per_user_limit: int,
+        model_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.global_limit = global_limit
+        self.per_model_limit = per_model_limit
+        self.per_user_limit = per_user_limit
+        self.model_limits = model_limits or {}
+
+        self._running = 0
+        self._running_by_model: Dict[str, int] = defaultdict(int)
+        self._running_by_user: Dict[str, int] = defaultdict(int)
+        self._waiting: List[GenerationTicket] = []
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._order = itertools.count()
+
+    def _model_limit(self, model: str) -> int:
+        return self.model_limits.get(model, self.per_model_limit)
+
+    def _can_run(self, ticket: GenerationTicket) -> bool:
+        return (
+            self._running < self.global_limit
+            and self._running_by_model[ticket.model] < self._model_limit(ticket.model)
+            and self._running_by_user[ticket.user_id] < self.per_user_limit
+        )
+
+    def _start(self, ticket: GenerationTicket):
+        self._running += 1
+        self._running_by_model[ticket.model] += 1
+        self._running_by_user[ticket.user_id] += 1
+        self._virtual_time = max(self._virtual_time, ticket.start_tag)
+        ticket.queue_wait = time.monotonic() - ticket.enqueued_at
+        metrics.observe("scheduler.queue_wait_seconds", ticket.queue_wait)
+        ticket.granted.set_result(True)
+
+    def _dispatch(self):
+        for ticket in list(self._waiting):
+            if self._running >= self.global_limit:
+                break
+            if self._can_run(ticket):
+                self._waiting.remove(ticket)
+                self._start(ticket)
+        self._report()
+
+    def _report(self):
+        metrics.set_gauge("scheduler.running", self._running)
+        metrics.set_gauge("scheduler.waiting", len(self._waiting))
+
+    def position(self, ticket: GenerationTicket) -> int:
+        """1-based position of a waiting ticket (0 once started)."""
+        try:
+            return self._waiting.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def _forget_if_idle(self, user_id: str):
+        # A user with nothing running or waiting starts again from the
+        # current virtual time, so its finish tag is no longer needed
+        if user_id not in self._running_by_user and not any(
+            t.user_id == user_id for t in self._waiting
+        ):
+            self._last_finish.pop(user_id, None)
+
+    def _release(self, ticket: GenerationTicket):
+        self._running -= 1
+        self._running_by_model[ticket.model] -= 1
+        self._running_by_user[ticket.user_id] -= 1
+        if not self._running_by_model[ticket.model]:
+            del self._running_by_model[ticket.model]
+        if not self._running_by_user[ticket.user_id]:
+            del self._running_by_user[ticket.user_id]
+        self._dispatch()
+        self._forget_if_idle(ticket.user_id)
+
+    async def acquire(
+        self,
+        user_id: str,
+        model: str,
+        weight: float = 1.0,
+        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> GenerationTicket:
+        start_tag = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        finish_tag = start_tag + 1.0 / max(weight, 0.01)
+        self._last_finish[user_id] = finish_tag
+
+        ticket = GenerationTicket(
+            user_id, model, start_tag, finish_tag, next(self._order)
+        )
+        self._waiting.append(ticket)
+        self._waiting.sort(key=lambda t: (t.finish_tag, t.order))
+        self._dispatch()
+
+        last_position = 0
+        try:
+            while not ticket.granted.done():
+                position = self.position(ticket)
+                if on_queued is not None and position and position != last_position:
+                    last_position = position
+                    try:
+                        await on_queued(position)
+                    except Exception as e:
+                        print(f"Error reporting queue position: {e}")
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(ticket.granted),
+                        timeout=settings.GENERATION_QUEUE_REPORT_INTERVAL,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self._report()
+                self._forget_if_idle(user_id)
+            elif ticket.granted.done():
+                self._release(ticket)
+            raise
+
+        return ticket
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: str,
+        model: str,
+        weight: float = 1.0,
+        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+    ):
+        """Hold a generation slot for the duration of the block."""
+        ticket = await self.acquire(user_id, model, weight, on_queued)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+
+generation_scheduler = GenerationScheduler(
+    global_limit=settings.GENERATION_GLOBAL_LIMIT,
+    per_model_limit=settings.GENERATION_PER_MODEL_LIMIT,
+    per_user_limit=settings.GENERATION_PER_USER_LIMIT,
+    model_limits=settings.GENERATION_MODEL_LIMITS,
+)
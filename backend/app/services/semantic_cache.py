@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from meilisearch_python_sdk.models.search import Hybrid
+
+from app.db.meilisearch import get_meilisearch_client
+from app.db.redis import get_redis_client
+from app.db.write_buffer import write_buffer
+from app.services.embeddings import request_embeddings
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# One prune per SEMANTIC_CACHE_PRUNE_INTERVAL across all the processes
+PRUNE_LOCK_KEY = "semantic_cache:prune_lock"
+
+_pruner_task: Optional[asyncio.Task] = None
+
+
+def cache_scope(model: str, messages: List[Dict[str, str]], user_id: str) -> str:
+    """
+    Answers are only shared between requests of the same user with the same
+    model and system prompt: questions may carry private document context.
+    """
+    system_prompt = "\n".join(
+        msg["content"] for msg in messages if msg["role"] == "system"
+    )
+    return hashlib.sha256(
+        f"{user_id}\0{model}\0{system_prompt}".encode("utf-8")
+    ).hexdigest()[:32]
+
+
+def cacheable_question(messages: List[Dict[str, str]]) -> Optional[str]:
+    """
+    The question to look up, or None if the request is not a first turn:
+    with earlier assistant answers in the context, a previous answer to a
+    similar question may no longer fit.
+    """
+    if any(msg["role"] == "assistant" for msg in messages):
+        return None
+    user_messages = [msg["content"] for msg in messages if msg["role"] == "user"]
+    if len(user_messages) != 1 or not user_messages[0].strip():
+        return None
+    return user_messages[0].strip()
+
+
+def _record(hit: bool):
+    metrics.incr("semantic_cache.hits" if hit else "semantic_cache.misses")
+    hits = metrics.counters["semantic_cache.hits"]
+    lookups = hits + metrics.counters["semantic_cache.misses"]
+    metrics.set_gauge("semantic_cache.hit_rate", round(hits / lookups, 4))
+
+
+async def lookup(
+    model: str, messages: List[Dict[str, str]], user_id: Optional[str]
+) -> Tuple[Optional[str], Optional[List[float]]]:
+    """
+    Look for the answer to a similar question of the same user. Returns
+    (answer, vector): the vector of the question is returned on a miss so
+    that storing the new answer does not need another embedding call.
+    """
+    question = cacheable_question(messages)
+    if not settings.SEMANTIC_CACHE_ENABLED or question is None or not user_id:
+        return None, None
+
+    try:
+        vector = await request_embeddings(question, query=True)
+        if not vector:
+            return None, None
+
+        client = await get_meilisearch_client()
+        result = await client.index(settings.RESPONSE_CACHE_INDEX).search(
+            "",
+            vector=vector,
+            hybrid=Hybrid(semantic_ratio=1.0, embedder=settings.EMBEDDER_NAME),
+            filter=(
+                f'scope = "{cache_scope(model, messages, user_id)}" '
+                f"AND created_at > {int(time.time()) - settings.SEMANTIC_CACHE_TTL}"
+            ),
+            limit=1,
+            show_ranking_score=True,
+        )
+    except Exception as e:
+        print(f"Error looking up semantic cache: {e}")
+        return None, None
+
+    if result.hits and result.hits[0].get("_rankingScore", 0) >= settings.SEMANTIC_CACHE_THRESHOLD:
+        _record(hit=True)
+        return result.hits[0]["answer"], vector
+
+    _record(hit=False)
+    return None, vector
+
+
+def store(
+    model: str,
+    messages: List[Dict[str, str]],
+    user_id: Optional[str],
+    vector: Optional[List[float]],
+    answer: str,
+):
+    """Cache the answer of a first-turn question whose vector was computed by lookup."""
+    question = cacheable_question(messages)
+    if (
+        not settings.SEMANTIC_CACHE_ENABLED
+        or question is None
+        or not user_id
+        or not vector
+        or not answer
+    ):
+        return
+
+    write_buffer.add_documents(
+        settings.RESPONSE_CACHE_INDEX,
+        [
+            {
+                "id": str(uuid.uuid4()),
+                "scope": cache_scope(model, messages, user_id),
+                "model": model,
+                "question": question,
+                "answer": answer,
+                "created_at": int(time.time()),
+                "_vectors": {settings.EMBEDDER_NAME: vector},
+            }
+        ],
+    )
+
+
+async def prune_expired():
+    """Delete the cached answers older than SEMANTIC_CACHE_TTL."""
+    client = await get_meilisearch_client()
+    await client.index(settings.RESPONSE_CACHE_INDEX).delete_documents_by_filter(
+        f"created_at < {int(time.time()) - settings.SEMANTIC_CACHE_TTL}"
+    )
+    metrics.incr("semantic_cache.prunes")
+
+
+async def _run_pruner():
+    redis_client = get_redis_client()
+    while True:
+        try:
+            if await redis_client.set(
+                PRUNE_LOCK_KEY, "1", nx=True, ex=settings.SEMANTIC_CACHE_PRUNE_INTERVAL
+            ):
+                await prune_expired()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error pruning semantic cache: {e}")
+        await asyncio.sleep(settings.SEMANTIC_CACHE_PRUNE_INTERVAL)
+
+
+def start_cache_pruner():
+    global _pruner_task
+    if (
+        _pruner_task is None
+        and settings.SEMANTIC_CACHE_ENABLED
+        and settings.SEMANTIC_CACHE_PRUNE_INTERVAL > 0
+    ):
+        _pruner_task = asyncio.create_task(_run_pruner())
+
+
+async def stop_cache_pruner():
+    global _pruner_task
+    if _pruner_task is not None:
+        _pruner_task.cancel()
+        try:
+            await _pruner_task
+        except asyncio.CancelledError:
+            pass
+        _pruner_task = None
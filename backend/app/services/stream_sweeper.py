@@ -0,0 +1,205 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from app.db.redis import get_redis_client
+from app.services.streams import GenerationStreamWriter, _decode_entry, _is_final
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# One sweep per STREAM_SWEEP_INTERVAL across all the processes
+SWEEP_LOCK_KEY = "stream_sweeper:lock"
+
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+def _entry_age(entry_id: str) -> float:
+    # Stream entry IDs start with their creation time in milliseconds
+    return time.time() - int(entry_id.split("-")[0]) / 1000
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def _memory_usage(keys: List[str]) -> Dict[str, int]:
+    redis_client = get_redis_client()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.memory_usage(key)
+        sizes = await pipe.execute()
+    return {key: size or 0 for key, size in zip(keys, sizes)}
+
+
+async def _sweep_streams(keys: List[str], report: Dict[str, int]):
+    """
+    Finished streams left uncompacted are trimmed to their final entry;
+    streams without a final entry nor any write for STREAM_ORPHAN_TIMEOUT
+    (their generation died) are closed with an error entry, which compacts
+    them; streams without expiry get one.
+    """
+    redis_client = get_redis_client()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.ttl(key)
+            pipe.xlen(key)
+            pipe.xrevrange(key, count=1)
+        results = await pipe.execute()
+
+    before = await _memory_usage(keys)
+    touched = []
+
+    for i, key in enumerate(keys):
+        ttl, length, last = results[3 * i : 3 * i + 3]
+        if ttl == -2:
+            continue  # Expired in the meantime
+
+        if not last:
+            await redis_client.delete(key)
+            report["keys_deleted"] += 1
+            report["bytes_reclaimed"] += before[key]
+            continue
+
+        event = _decode_entry(*last[0])
+        if _is_final(event):
+            if length > 1:
+                await redis_client.xtrim(key, maxlen=1, approximate=False)
+                report["streams_compacted"] += 1
+                touched.append(key)
+        elif _entry_age(event["id"]) > settings.STREAM_ORPHAN_TIMEOUT:
+            writer = await GenerationStreamWriter.resume(key.split(":", 1)[1])
+            if not writer.finished:  # Unless it ended in the meantime
+                await writer.error("Generation interrupted, please retry")
+                report["orphans_closed"] += 1
+                touched.append(key)
+                continue  # The error entry set the expiry
+
+        if ttl == -1:
+            await redis_client.expire(key, settings.STREAM_TTL)
+            report["expiry_set"] += 1
+
+    if touched:
+        after = await _memory_usage(touched)
+        report["bytes_reclaimed"] += sum(
+            max(before[key] - after[key], 0) for key in touched
+        )
+
+
+async def _sweep_sessions(keys: List[str], report: Dict[str, int]):
+    """
+    Session keys are created with an expiry: those without one are deleted
+    if their stream is gone and they are older than STREAM_TTL, otherwise
+    they get one.
+    """
+    redis_client = get_redis_client()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.ttl(key)
+        ttls = await pipe.execute()
+
+    leaked = [key for key, ttl in zip(keys, ttls) if ttl == -1]
+    if not leaked:
+        return
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in leaked:
+            pipe.get(key)
+            pipe.exists(f"stream:{key.split(':', 1)[1]}")
+        results = await pipe.execute()
+    sizes = await _memory_usage(leaked)
+
+    for i, key in enumerate(leaked):
+        data, stream_exists = results[2 * i : 2 * i + 2]
+        created_at = 0
+        try:
+            created_at = json.loads(data)["created_at"] if data else 0
+        except (ValueError, KeyError):
+            pass
+
+        if not stream_exists and time.time() - created_at > settings.STREAM_TTL:
+            await redis_client.delete(key)
+            report["keys_deleted"] += 1
+            report["bytes_reclaimed"] += sizes[key]
+        else:
+            await redis_client.expire(key, settings.STREAM_TTL)
+            report["expiry_set"] += 1
+
+
+async def sweep_streams() -> Dict[str, Any]:
+    """
+    Reclaim the generation streams (stream:*) and sessions (session_info:*)
+    left behind, STREAM_SWEEP_BATCH keys at a time. Returns a report of
+    what was reclaimed, including the memory freed in bytes (as estimated
+    by MEMORY USAGE).
+    """
+    redis_client = get_redis_client()
+    report = {
+        "keys_scanned": 0,
+        "keys_deleted": 0,
+        "streams_compacted": 0,
+        "orphans_closed": 0,
+        "expiry_set": 0,
+        "bytes_reclaimed": 0,
+    }
+
+    for pattern, sweep, key_type in (
+        ("stream:*", _sweep_streams, "stream"),
+        ("session_info:*", _sweep_sessions, "string"),
+    ):
+        batch: List[str] = []
+        async for key in redis_client.scan_iter(
+            match=pattern, count=settings.STREAM_SWEEP_BATCH, _type=key_type
+        ):
+            batch.append(_decode(key))
+            if len(batch) >= settings.STREAM_SWEEP_BATCH:
+                await sweep(batch, report)
+                report["keys_scanned"] += len(batch)
+                batch = []
+        if batch:
+            await sweep(batch, report)
+            report["keys_scanned"] += len(batch)
+
+    metrics.incr("stream_sweeper.runs")
+    for name in ("keys_deleted", "streams_compacted", "orphans_closed", "expiry_set", "bytes_reclaimed"):
+        metrics.incr(f"stream_sweeper.{name}", report[name])
+    metrics.set_gauge("stream_sweeper.last_bytes_reclaimed", report["bytes_reclaimed"])
+    return report
+
+
+async def _run_sweeper():
+    redis_client = get_redis_client()
+    while True:
+        try:
+            if await redis_client.set(
+                SWEEP_LOCK_KEY, "1", nx=True, ex=settings.STREAM_SWEEP_INTERVAL
+            ):
+                report = await sweep_streams()
+                print(
+                    f"Stream sweep: {report['keys_scanned']} keys scanned, "
+                    f"{report['keys_deleted']} deleted, {report['streams_compacted']} compacted, "
+                    f"{report['orphans_closed']} orphans closed, {report['expiry_set']} expiries set, "
+                    f"{report['bytes_reclaimed']} bytes reclaimed"
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sweeping generation streams: {e}")
+        await asyncio.sleep(settings.STREAM_SWEEP_INTERVAL)
+
+
+def start_stream_sweeper():
+    global _sweeper_task
+    if _sweeper_task is None and settings.STREAM_SWEEP_INTERVAL > 0:
+        _sweeper_task = asyncio.create_task(_run_sweeper())
+
+
+async def stop_stream_sweeper():
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+        _sweeper_task = None
@@ -0,0 +1,358 @@
+from typing import Dict, Any, AsyncGenerator, List, Optional
+import asyncio
+import time
+
+from app.db.redis import get_redis_client
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Version 2 of the stream protocol:
+# - "token" entries only carry the new text (delta) and a sequence number;
+# - a "snapshot" entry with the full content so far is written every
+#   STREAM_SNAPSHOT_EVERY_TOKENS tokens or STREAM_SNAPSHOT_EVERY_BYTES bytes,
+#   so that late readers can catch up without replaying every delta;
+# - the "end" entry carries the full content once.
+# Entries are written with maxlen and their expiry refreshed on every write.
+# Once the final ("end" or "error") entry is written, the stream is compacted
+# down to that entry: it holds the full content, readers still waiting get it
+# as the next entry after their last one, and late readers start from it.
+STREAM_PROTOCOL_VERSION = "2"
+
+
+def stream_key(session_id: str) -> str:
+    return f"stream:{session_id}"
+
+
+class GenerationStreamWriter:
+    """
+    Write the events of one generation to its Redis Stream.
+
+    Tokens are coalesced for STREAM_COALESCE_MS (or until
+    STREAM_COALESCE_BYTES bytes are pending) into a single delta entry;
+    pending entries are written in one pipelined round trip that also
+    refreshes the stream's expiry.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.key = stream_key(session_id)
+        self.redis = get_redis_client()
+        self.content = ""
+        self.seq = 0
+        # The stream already ends with a final entry (see resume)
+        self.finished = False
+        self._pending_delta = ""
+        self._pending_bytes = 0
+        self._tokens_since_snapshot = 0
+        self._bytes_since_snapshot = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def resume(cls, session_id: str) -> "GenerationStreamWriter":
+        """
+        Writer continuing an existing stream, its content rebuilt from the
+        latest snapshot and the deltas after it (used to close the stream of
+        a generation whose process died). If the stream already ended, the
+        writer is returned with `finished` set and nothing must be written:
+        a final entry would replace the completed answer.
+        """
+        writer = cls(session_id)
+        start = "-"
+        snapshot = await _catch_up(writer.key)
+        if snapshot is not None:
+            writer.content = snapshot.get("full_content", "")
+            writer.seq = int(snapshot.get("seq") or 0)
+            writer.finished = _is_final(snapshot)
+            start = f"({snapshot['id']}"
+
+        for message_id, fields in await writer.redis.xrange(writer.key, min=start):
+            event = _decode_entry(message_id, fields)
+            if _is_final(event):
+                writer.finished = True
+            elif event.get("type") == "token":
+                writer.content += event.get("content", "")
+                writer.seq = int(event.get("seq") or writer.seq)
+        return writer
+
+    async def _send(self, entries: List[Dict[str, str]], final: bool = False):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if final:
+                pipe.memory_usage(self.key)
+            for fields in entries:
+                fields.setdefault("timestamp", str(time.time()))
+                pipe.xadd(
+                    self.key, fields, maxlen=settings.STREAM_MAXLEN, approximate=True
+                )
+            if final:
+                # Only the final entry is needed from now on
+                pipe.xtrim(self.key, maxlen=1, approximate=False)
+                pipe.memory_usage(self.key)
+            pipe.expire(self.key, settings.STREAM_TTL)
+            results = await pipe.execute()
+
+        metrics.incr("stream.round_trips")
+        metrics.incr("stream.entries", len(entries))
+        if final:
+            before, after = results[0] or 0, results[-2] or 0
+            metrics.incr("stream.compactions")
+            metrics.incr("stream.compacted_bytes", max(before - after, 0))
+
+    def _drain(self) -> List[Dict[str, str]]:
+        """Turn the pending delta into a token entry (and a snapshot if due)."""
+        if not self._pending_delta:
+            return []
+
+        self.seq += 1
+        entries = [
+            {
+                "type": "token",
+                "content": self._pending_delta,
+                "seq": str(self.seq),
+                "done": "false",
+            }
+        ]
+        self._tokens_since_snapshot += 1
+        self._bytes_since_snapshot += self._pending_bytes
+        self._pending_delta = ""
+        self._pending_bytes = 0
+
+        if (
+            self._tokens_since_snapshot >= settings.STREAM_SNAPSHOT_EVERY_TOKENS
+            or self._bytes_since_snapshot >= settings.STREAM_SNAPSHOT_EVERY_BYTES
+        ):
+            entries.append(self._snapshot_entry())
+
+        return entries
+
+    def _snapshot_entry(self) -> Dict[str, str]:
+        self._tokens_since_snapshot = 0
+        self._bytes_since_snapshot = 0
+        return {
+            "type": "snapshot",
+            "content": "",
+            "full_content": self.content,
+            "seq": str(self.seq),
+            "done": "false",
+        }
+
+    async def _add(self, fields: Dict[str, str], final: bool = False):
+        # Pending tokens always precede the new entry, in the same round trip
+        async with self._lock:
+            entries = self._drain()
+            entries.append(fields)
+            await self._send(entries, final=final)
+
+    async def flush(self):
+        async with self._lock:
+            entries = self._drain()
+            if entries:
+                await self._send(entries)
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(settings.STREAM_COALESCE_MS / 1000)
+            self._flush_task = None
+            await self.flush()
+        except Exception as e:
+            print(f"Error flushing tokens to Redis Stream: {e}")
+
+    async def start(self, model: str, **extra: str):
+        await self._add(
+            {
+                "type": "start",
+                "content": "",
+                "model": model,
+                "protocol": STREAM_PROTOCOL_VERSION,
+                "done": "false",
+                **extra,
+            }
+        )
+
+    async def token(self, delta: str):
+        if not delta:
+            return
+
+        self.content += delta
+        self._pending_delta += delta
+        self._pending_bytes += len(delta.encode("utf-8"))
+        metrics.incr("stream.tokens")
+
+        if (
+            settings.STREAM_COALESCE_MS <= 0
+            or self._pending_bytes >= settings.STREAM_COALESCE_BYTES
+        ):
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def snapshot(self):
+        async with self._lock:
+            entries = self._drain()
+            entries.append(self._snapshot_entry())
+            await self._send(entries)
+
+    async def end(self, **extra: str):
+        await self._add(
+            {
+                "type": "end",
+                "content": "",
+                "full_content": self.content,
+                "seq": str(self.seq),
+                "done": "true",
+                **extra,
+            },
+            final=True,
+        )
+
+    async def error(self, error: str):
+        await self._add(
+            {
+                "type": "error",
+                "content": "",
+                "full_content": self.content,
+                "error": error,
+                "done": "true",
+            },
+            final=True,
+        )
+
+
+async def write_queued_event(session_id: str, position: int):
+    """Tell readers a generation is waiting for a slot, and at which position."""
+    redis_client = get_redis_client()
+    key = stream_key(session_id)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.xadd(
+            key,
+            {
+                "type": "queued",
+                "content": "",
+                "position": str(position),
+                "done": "false",
+                "timestamp": str(time.time()),
+            },
+            maxlen=settings.STREAM_MAXLEN,
+            approximate=True,
+        )
+        pipe.expire(key, settings.STREAM_TTL)
+        await pipe.execute()
+
+
+def _decode_entry(message_id, fields) -> Dict[str, Any]:
+    decoded_fields = {
+        k.decode(): v.decode() if isinstance(v, bytes) else v for k, v in fields.items()
+    }
+    message_id = message_id.decode() if isinstance(message_id, bytes) else message_id
+    return {"id": message_id, **decoded_fields}
+
+
+def _is_final(event: Dict[str, Any]) -> bool:
+    return event.get("type") == "end" or event.get("done") == "true"
+
+
+async def _catch_up(stream_key_: str) -> Optional[Dict[str, Any]]:
+    """
+    Find the latest snapshot (or final entry) of a stream, looking back at
+    most one snapshot interval, so a new reader can start from it.
+    """
+    redis_client = get_redis_client()
+    entries = await redis_client.xrevrange(
+        stream_key_, count=settings.STREAM_SNAPSHOT_EVERY_TOKENS + 16
+    )
+    for message_id, fields in entries:
+        event = _decode_entry(message_id, fields)
+        if event.get("type") == "snapshot" or _is_final(event):
+            return event
+    return None
+
+
+async def read_stream_messages(
+    session_id: str, last_id: str = "0"
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Read messages from a Redis Stream for a given session ID.
+    Yields events as they become available. A reader starting from the
+    beginning first receives the latest snapshot instead of every delta.
+    A reader that falls behind by more than STREAM_MAXLEN entries misses
+    trimmed deltas: the gap in the token sequence numbers is detected and
+    the reader resumes from the latest snapshot, yielded with resync=true.
+    """
+    redis_client = get_redis_client()
+    try:
+        stream_key_ = stream_key(session_id)
+
+        # Sequence number of the last token received (unknown mid-stream)
+        last_seq = None
+        if last_id == "0":
+            last_seq = 0
+            snapshot = await _catch_up(stream_key_)
+            if snapshot is not None:
+                yield snapshot
+                if _is_final(snapshot):
+                    return
+                last_id = snapshot["id"]
+                last_seq = int(snapshot.get("seq") or 0)
+
+        done = False
+
+        while not done:
+            # Read from the stream with a timeout
+            try:
+                items = await redis_client.xread(
+                    streams={stream_key_: last_id},
+                    count=10,
+                    block=3000,  # Block for 3 seconds
+                )
+            except Exception as e:
+                print(f"Error reading from Redis Stream: {e}")
+                yield {"error": str(e), "done": "true"}
+                return
+
+            # If we have items, process them
+            if items:
+                for stream_name, messages in items:
+                    for message_id, fields in messages:
+                        event_data = _decode_entry(message_id, fields)
+                        seq = event_data.get("seq")
+
+                        if (
+                            event_data.get("type") == "token"
+                            and last_seq is not None
+                            and seq
+                            and int(seq) > last_seq + 1
+                        ):
+                            # Deltas trimmed before this reader got them
+                            snapshot = await _catch_up(stream_key_)
+                            if snapshot is not None:
+                                metrics.incr("stream.reader_resyncs")
+                                snapshot["resync"] = "true"
+                                yield snapshot
+                                if _is_final(snapshot):
+                                    return
+                                last_id = snapshot["id"]
+                                last_seq = int(snapshot.get("seq") or 0)
+                                break  # Read on from the snapshot
+
+                        if seq and event_data.get("type") in ("token", "snapshot"):
+                            last_seq = int(seq)
+
+                        # Update last_id for the next iteration
+                        last_id = event_data["id"]
+
+                        # Check if this is the end message
+                        if _is_final(event_data):
+                            done = True
+
+                        # Yield the event data
+                        yield event_data
+            else:
+                # Check if the stream exists
+                exists = await redis_client.exists(stream_key_)
+                if not exists:
+                    print(f"Stream {stream_key_} no longer exists")
+                    yield {"error": "Stream no longer exists", "done": "true"}
+                    return
+    except Exception as e:
+        print(f"Error reading from Redis Stream: {e}")
+        yield {"error": str(e), "done": "true"}
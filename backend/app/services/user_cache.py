@@ -0,0 +1,102 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.redis import get_redis_client
+from app.models.user import User
+
+# Cache LRU + TTL des utilisateurs résolus, indexé par id
+_cache: "OrderedDict[str, tuple[float, User]]" = OrderedDict()
+_listener_task: Optional[asyncio.Task] = None
+
+
+def get_cached_user(user_id: str) -> Optional[User]:
+    """Retourne l'utilisateur en cache s'il est présent et non expiré."""
+    entry = _cache.get(user_id)
+    if entry is None:
+        metrics.incr("user_cache.misses")
+        return None
+
+    expires_at, user = entry
+    if expires_at < time.monotonic():
+        _cache.pop(user_id, None)
+        metrics.incr("user_cache.misses")
+        return None
+
+    _cache.move_to_end(user_id)
+    metrics.incr("user_cache.hits")
+    return user
+
+
+def cache_user(user: User):
+    """Ajoute un utilisateur au cache en évinçant le moins récemment utilisé."""
+    if settings.USER_CACHE_SIZE <= 0:
+        return
+
+    _cache[user.id] = (time.monotonic() + settings.USER_CACHE_TTL, user)
+    _cache.move_to_end(user.id)
+    while len(_cache) > settings.USER_CACHE_SIZE:
+        _cache.popitem(last=False)
+        metrics.incr("user_cache.evictions")
+    metrics.set_gauge("user_cache.size", len(_cache))
+
+
+def evict_user(user_id: str):
+    """Supprime un utilisateur du cache local uniquement."""
+    if _cache.pop(user_id, None) is not None:
+        metrics.incr("user_cache.invalidations")
+    metrics.set_gauge("user_cache.size", len(_cache))
+
+
+async def invalidate_user(user_id: str):
+    """
+    Invalide un utilisateur dans le cache de tous les workers.
+    À appeler après toute mise à jour ou désactivation d'un utilisateur.
+    """
+    evict_user(user_id)
+    try:
+        await get_redis_client().publish(settings.USER_CACHE_CHANNEL, user_id)
+    except Exception as e:
+        print(f"Error publishing user cache invalidation: {e}")
+
+
+async def _listen_invalidations():
+    while True:
+        pubsub = get_redis_client().pubsub()
+        try:
+            await pubsub.subscribe(settings.USER_CACHE_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = message.get("data")
+                evict_user(data.decode() if isinstance(data, bytes) else data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"User cache invalidation listener error: {e}")
+            # Les invalidations manquées pendant la coupure sont perdues
+            _cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+def start_user_cache_listener():
+    global _listener_task
+    if _listener_task is None:
+        _listener_task = asyncio.create_task(_listen_invalidations())
+
+
+async def stop_user_cache_listener():
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
+    _cache.clear()
@@ -0,0 +1,92 @@
+"""
+Compare la latence d'un chargement de document par filtre de recherche
+(search(filter="id = X AND user_id = Y")) et par clé primaire (get_owned).
+
+Crée un index temporaire rempli de documents synthétiques, puis le supprime.
+
+Usage (depuis backend/, Meilisearch démarré) :
+    python -m benchmarks.bench_document_fetch --documents 10000 --lookups 500
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+from app.db.meilisearch import get_meilisearch_client, close_meilisearch
+from app.db.repository import get_owned
+
+BENCH_INDEX = "bench_document_fetch"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, timings):
+    timings_ms = [value * 1000 for value in timings]
+    print(
+        f"{name:>12}: p50={statistics.median(timings_ms):.2f}ms "
+        f"p99={percentile(timings_ms, 99):.2f}ms mean={statistics.mean(timings_ms):.2f}ms"
+    )
+
+
+async def run(document_count: int, lookups: int):
+    client = await get_meilisearch_client()
+    index = await client.create_index(BENCH_INDEX, primary_key="id")
+
+    try:
+        task = await index.update_filterable_attributes(["id", "user_id"])
+        await client.wait_for_task(task.task_uid)
+
+        user_ids = [str(uuid.uuid4()) for _ in range(100)]
+        documents = [
+            {
+                "id": str(uuid.uuid4()),
+                "user_id": random.choice(user_ids),
+                "title": f"Document {i}",
+                "content": "lorem ipsum " * 50,
+            }
+            for i in range(document_count)
+        ]
+        for start in range(0, document_count, 1000):
+            task = await index.add_documents(documents[start : start + 1000])
+            await client.wait_for_task(task.task_uid, timeout_in_ms=120000)
+
+        samples = random.sample(documents, min(lookups, document_count))
+
+        search_timings = []
+        for document in samples:
+            started = time.perf_counter()
+            await index.search(
+                filter=f"id = {document['id']} AND user_id = {document['user_id']}",
+                limit=1,
+            )
+            search_timings.append(time.perf_counter() - started)
+
+        fetch_timings = []
+        for document in samples:
+            started = time.perf_counter()
+            await get_owned(BENCH_INDEX, document["id"], document["user_id"])
+            fetch_timings.append(time.perf_counter() - started)
+
+        report("search", search_timings)
+        report("get_owned", fetch_timings)
+    finally:
+        await client.delete_index_if_exists(BENCH_INDEX)
+        await close_meilisearch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.documents, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
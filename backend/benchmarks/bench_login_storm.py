@@ -0,0 +1,80 @@
+"""
+Mesure la latence p99 d'émission de tokens SSE pendant une rafale de connexions.
+
+Un « flux SSE » simulé émet un token toutes les 20 ms et enregistre son retard ;
+en parallèle, une rafale de vérifications bcrypt est lancée soit directement dans
+la boucle d'événements (ancien comportement), soit via le pool dédié.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_login_storm --logins 50 --streams 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.services.auth import pwd_context, verify_password
+
+TOKEN_INTERVAL = 0.02
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def fake_sse_stream(stop: asyncio.Event, lateness: list):
+    expected = time.perf_counter() + TOKEN_INTERVAL
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, expected - time.perf_counter()))
+        lateness.append(time.perf_counter() - expected)
+        expected += TOKEN_INTERVAL
+
+
+async def inline_login(hashed):
+    pwd_context.verify("password", hashed)
+
+
+async def offloaded_login(hashed):
+    await verify_password("password", hashed)
+
+
+async def run(mode: str, logins: int, streams: int):
+    hashed = pwd_context.hash("password")
+    login = inline_login if mode == "inline" else offloaded_login
+
+    stop = asyncio.Event()
+    lateness: list = []
+    stream_tasks = [
+        asyncio.create_task(fake_sse_stream(stop, lateness)) for _ in range(streams)
+    ]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await asyncio.gather(*stream_tasks)
+
+    lateness_ms = [value * 1000 for value in lateness] or [0.0]
+    print(
+        f"{mode:>9}: {logins} logins in {elapsed:.2f}s | "
+        f"token lateness p50={statistics.median(lateness_ms):.1f}ms "
+        f"p99={percentile(lateness_ms, 99):.1f}ms "
+        f"max={max(lateness_ms):.1f}ms ({len(lateness)} ticks)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--streams", type=int, default=20)
+    args = parser.parse_args()
+
+    for mode in ("inline", "offloaded"):
+        asyncio.run(run(mode, args.logins, args.streams))
+
+
+if __name__ == "__main__":
+    main()
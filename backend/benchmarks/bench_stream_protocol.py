@@ -0,0 +1,123 @@
+"""
+Compare la mémoire Redis et la bande passante d'une génération selon le protocole
+de flux : v1 (chaque token porte tout le contenu déjà généré) et v2 (deltas +
+snapshots périodiques).
+
+Pour chaque protocole : octets écrits, MEMORY USAGE du flux terminé, et octets
+lus par un lecteur arrivant en fin de génération.
+
+Usage (depuis backend/, Redis démarré) :
+    python -m benchmarks.bench_stream_protocol --tokens 4000
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+from app.db.redis import get_redis_client
+from app.services.streams import GenerationStreamWriter, read_stream_messages
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+
+
+def fake_tokens(count: int):
+    rng = random.Random(42)
+    return [" " + rng.choice(WORDS) for _ in range(count)]
+
+
+def entry_size(fields: dict) -> int:
+    return sum(len(str(k).encode()) + len(str(v).encode()) for k, v in fields.items())
+
+
+async def write_v1(redis_client, key: str, tokens) -> int:
+    written = 0
+    full_response = ""
+    for token in tokens:
+        full_response += token
+        fields = {
+            "type": "token",
+            "content": token,
+            "full_content": full_response,
+            "timestamp": str(time.time()),
+            "done": "false",
+        }
+        written += entry_size(fields)
+        await redis_client.xadd(key, fields, maxlen=1000)
+    fields = {
+        "type": "end",
+        "content": "",
+        "full_content": full_response,
+        "done": "true",
+        "timestamp": str(time.time()),
+    }
+    written += entry_size(fields)
+    await redis_client.xadd(key, fields)
+    return written
+
+
+async def write_v2(session_id: str, tokens) -> int:
+    writer = GenerationStreamWriter(session_id)
+    written = 0
+    original_send = writer._send
+
+    async def counting_send(entries, final=False):
+        nonlocal written
+        await original_send(entries, final=final)
+        written += sum(entry_size(fields) for fields in entries)
+
+    writer._send = counting_send
+    await writer.start("bench")
+    for token in tokens:
+        await writer.token(token)
+    await writer.end()
+    return written
+
+
+async def read_v1(redis_client, key: str) -> int:
+    entries = await redis_client.xrange(key)
+    return sum(entry_size(fields) for _, fields in entries)
+
+
+async def read_v2(session_id: str) -> int:
+    read = 0
+    async for event in read_stream_messages(session_id):
+        read += entry_size({k: v for k, v in event.items() if k != "id"})
+    return read
+
+
+async def run(token_count: int):
+    redis_client = get_redis_client()
+    tokens = fake_tokens(token_count)
+
+    v1_key = f"stream:bench-v1-{uuid.uuid4()}"
+    v2_session = f"bench-v2-{uuid.uuid4()}"
+    v2_key = f"stream:{v2_session}"
+
+    try:
+        v1_written = await write_v1(redis_client, v1_key, tokens)
+        v2_written = await write_v2(v2_session, tokens)
+
+        v1_memory = await redis_client.memory_usage(v1_key)
+        v2_memory = await redis_client.memory_usage(v2_key)
+
+        v1_read = await read_v1(redis_client, v1_key)
+        v2_read = await read_v2(v2_session)
+
+        print(f"{token_count} tokens")
+        print(f"  v1: written={v1_written:>12,}B memory={v1_memory:>12,}B late reader={v1_read:>12,}B")
+        print(f"  v2: written={v2_written:>12,}B memory={v2_memory:>12,}B late reader={v2_read:>12,}B")
+    finally:
+        await redis_client.delete(v1_key, v2_key)
+        await redis_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=4000)
+    args = parser.parse_args()
+    asyncio.run(run(args.tokens))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Test de charge hors ligne du pipeline de streaming : scheduler →
+start_streaming_completion → Redis Streams → lecteur SSE (read_stream_messages),
+avec le fournisseur factice à la place d'un vrai modèle.
+
+Les sessions arrivent selon un processus de Poisson (--rate, 0 : toutes d'un coup).
+Pour chacune, un lecteur mesure le délai du premier token et la durée totale vus
+côté client, ainsi que les erreurs. Le profil de latence du modèle factice (TTFT,
+délai entre tokens, longueur des réponses, taux d'erreur) se règle en arguments
+pour reproduire un profil de production ; avec la même graine, deux exécutions
+envoient les mêmes réponses.
+
+Usage (depuis backend/, Redis démarré) :
+    python -m benchmarks.bench_streaming_pipeline --sessions 200 --rate 20 \\
+        --ttft-ms 300 --inter-token-ms 20 --tokens 200 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from urllib.parse import urlencode
+
+# Le fournisseur factice est enregistré à l'import des fournisseurs
+os.environ.setdefault("FAKE_PROVIDER_ENABLED", "true")
+
+from app.core.config import settings  # noqa: E402
+from app.core.metrics import metrics  # noqa: E402
+from app.db.redis import get_redis_client  # noqa: E402
+from app.models.models import CompletionRequest  # noqa: E402
+from app.services.llm import start_streaming_completion  # noqa: E402
+from app.services.scheduler import generation_scheduler  # noqa: E402
+from app.services.streams import read_stream_messages, stream_key, write_queued_event  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, timings):
+    if not timings:
+        print(f"{name:>12}: -")
+        return
+    timings_ms = [value * 1000 for value in timings]
+    print(
+        f"{name:>12}: p50={statistics.median(timings_ms):.1f}ms "
+        f"p95={percentile(timings_ms, 95):.1f}ms p99={percentile(timings_ms, 99):.1f}ms "
+        f"max={max(timings_ms):.1f}ms"
+    )
+
+
+async def run_session(index: int, model: str, users: int, results: dict):
+    session_id = f"bench-{uuid.uuid4()}"
+    request = CompletionRequest(
+        model=model,
+        session_id=session_id,
+        messages=[{"role": "user", "content": f"Question {index}"}],
+        stream=True,
+    )
+
+    async def generate():
+        async with generation_scheduler.slot(
+            f"bench-user-{index % users}",
+            model,
+            on_queued=lambda position: write_queued_event(session_id, position),
+        ) as ticket:
+            await start_streaming_completion(request, queue_wait=ticket.queue_wait)
+
+    start = time.perf_counter()
+    generation = asyncio.create_task(generate())
+    first_token = None
+    failed = False
+
+    async for event in read_stream_messages(session_id):
+        if first_token is None and event.get("type") in ("token", "snapshot"):
+            first_token = time.perf_counter() - start
+        if event.get("error"):
+            failed = True
+        if event.get("type") == "end" or event.get("done") == "true":
+            break
+
+    await generation
+    results["sessions"].append(session_id)
+    if failed:
+        results["errors"] += 1
+        return
+    results["ttft"].append(first_token if first_token is not None else time.perf_counter() - start)
+    results["total"].append(time.perf_counter() - start)
+
+
+async def run(args):
+    settings.FAKE_PROVIDER_SEED = args.seed
+    model = "fake?" + urlencode(
+        {
+            "ttft_ms": args.ttft_ms,
+            "inter_token_ms": args.inter_token_ms,
+            "jitter": args.jitter,
+            "tokens": args.tokens,
+            "tokens_sigma": args.tokens_sigma,
+            "error_rate": args.error_rate,
+        }
+    )
+    arrivals = random.Random(args.seed)
+    results = {"ttft": [], "total": [], "errors": 0, "sessions": []}
+    redis_client = get_redis_client()
+
+    start = time.perf_counter()
+    tasks = []
+    try:
+        for index in range(args.sessions):
+            tasks.append(asyncio.create_task(run_session(index, model, args.users, results)))
+            if args.rate > 0:
+                await asyncio.sleep(arrivals.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        print(f"{args.sessions} sessions in {elapsed:.1f}s ({args.sessions / elapsed:.1f}/s), {results['errors']} errors")
+        report("client TTFT", results["ttft"])
+        report("client total", results["total"])
+
+        histograms = metrics.snapshot()["histograms"]
+        for name in sorted(histograms):
+            if name.startswith("generation.") or name.startswith("scheduler."):
+                histogram = histograms[name]
+                print(
+                    f"  {name}: "
+                    f"count={histogram['count']} avg={histogram['avg']:.3f}"
+                )
+    finally:
+        if results["sessions"]:
+            await redis_client.delete(*[stream_key(session_id) for session_id in results["sessions"]])
+        await redis_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=0, help="arrivées par seconde (0 : toutes d'un coup)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--inter-token-ms", type=float, default=20)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--tokens-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 
-from app.api import auth, chat, models, knowledge, project
+from app.api import auth, chat, models, knowledge, project, metrics
 from app.core.config import settings
 from app.db.meilisearch import init_meilisearch, close_meilisearch
+from app.db.write_buffer import close_write_buffer
+from app.services.user_cache import start_user_cache_listener, stop_user_cache_listener
+from app.services.auth import shutdown_password_hashing, rebuild_email_index
+from app.services.llm import prewarm_chat_models
+from app.services.cancellation import start_cancellation_listener, stop_cancellation_listener
+from app.services.providers import close_providers
+from app.services.embeddings import close_embeddings
+from app.services.semantic_cache import start_cache_pruner, stop_cache_pruner
+from app.services.stream_sweeper import start_stream_sweeper, stop_stream_sweeper
+from app.services.title_generator import close_title_batcher
 
 app = FastAPI(title="MiniWebUI")
 
@@ -16,15 +26,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Content-Length"],
 )
 
 # Événements de démarrage/arrêt
 @app.on_event("startup")
 async def startup_event():
     await init_meilisearch()
+    await rebuild_email_index()
+    start_user_cache_listener()
+    start_cancellation_listener()
+    start_stream_sweeper()
+    start_cache_pruner()
+    prewarm_chat_models()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await stop_user_cache_listener()
+    await stop_cancellation_listener()
+    await stop_stream_sweeper()
+    await stop_cache_pruner()
+    await close_title_batcher()
+    await close_providers()
+    await close_embeddings()
+    shutdown_password_hashing()
+    await close_write_buffer()
     await close_meilisearch()
 
 # Inclure les routes API
@@ -33,6 +59,7 @@ app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(models.router, prefix="/api", tags=["models"])
 app.include_router(knowledge.router, prefix="/api", tags=["knowledge"])
 app.include_router(project.router, prefix="/api", tags=["project"])
+app.include_router(metrics.router, prefix="/api", tags=["metrics"])
 
 # Créer les dossiers nécessaires
 os.makedirs("uploads", exist_ok=True)
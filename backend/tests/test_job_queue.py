@@ -0,0 +1,33 @@
+import asyncio
+
+from app.services.job_queue import GenerationWorker
+
+
+def test_drain_waits_for_cancelled_jobs():
+    async def scenario():
+        worker = GenerationWorker("test-consumer", concurrency=2)
+        events = []
+
+        async def slow_job():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                # What a cancelled generation does before stopping
+                await asyncio.sleep(0.01)
+                events.append("cancelled end written")
+                raise
+
+        async def quick_job():
+            events.append("completed")
+
+        worker._running = {
+            "1-0": asyncio.create_task(slow_job()),
+            "2-0": asyncio.create_task(quick_job()),
+        }
+        await worker.drain(timeout=0.05)
+
+        assert worker._stopping
+        assert sorted(events) == ["cancelled end written", "completed"]
+        assert all(task.done() for task in worker._running.values())
+
+    asyncio.run(scenario())
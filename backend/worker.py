@@ -0,0 +1,57 @@
+"""
+Worker de génération : consomme les jobs de la file Redis (GENERATION_JOB_STREAM)
+et exécute les générations, indépendamment des workers HTTP.
+
+Usage (depuis backend/, avec GENERATION_QUEUE_ENABLED=true côté API) :
+    python worker.py
+"""
+import asyncio
+import os
+import signal
+import socket
+
+from app.core.config import settings
+from app.db.meilisearch import init_meilisearch, close_meilisearch
+from app.db.write_buffer import close_write_buffer
+from app.services.llm import prewarm_chat_models
+from app.services.cancellation import start_cancellation_listener, stop_cancellation_listener
+from app.services.providers import close_providers
+from app.services.embeddings import close_embeddings
+from app.services.title_generator import close_title_batcher
+from app.services.job_queue import GenerationWorker
+
+
+async def main():
+    consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+    worker = GenerationWorker(consumer_name, settings.GENERATION_WORKER_CONCURRENCY)
+
+    await init_meilisearch()
+    start_cancellation_listener()
+    prewarm_chat_models()
+
+    # Arrêt propre : on ne prend plus de jobs et on laisse finir ceux en cours
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    run_task = asyncio.create_task(worker.run())
+    await asyncio.wait(
+        [run_task, asyncio.create_task(stop.wait())],
+        return_when=asyncio.FIRST_COMPLETED,
+    )
+
+    print(f"Generation worker {consumer_name} stopping")
+    await worker.drain(timeout=settings.GENERATION_WORKER_DRAIN_TIMEOUT)
+    run_task.cancel()
+
+    await stop_cancellation_listener()
+    await close_title_batcher()
+    await close_providers()
+    await close_embeddings()
+    await close_write_buffer()
+    await close_meilisearch()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -36,4 +36,21 @@ const api = ky.create({
 
 });
 
+/**
+ * Récupérer une page d'une liste paginée : le curseur de la page suivante
+ * est retourné dans l'en-tête X-Next-Cursor.
+ * @param {string} path Chemin de la liste
+ * @param {string|null} cursor Curseur de la page (null : première page)
+ * @returns {Promise<{items: Array, nextCursor: string|null}>} Éléments de la
+ * page et curseur de la suivante (null s'il n'y en a plus)
+ */
+export const getPage = async (path, cursor = null) => {
+  const searchParams = cursor ? { cursor } : {};
+  const response = await api.get(path, { searchParams });
+  return {
+    items: await response.json(),
+    nextCursor: response.headers.get("X-Next-Cursor"),
+  };
+};
+
 export default api;
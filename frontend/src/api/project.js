@@ -1,13 +1,15 @@
 // src/api/project.js
-import api from './config';
+import api, { getPage } from './config';
 
 /**
- * Récupérer la liste des projets
- * @returns {Promise<Array>} Liste des projets
+ * Récupérer une page de la liste des projets
+ * @param {string|null} cursor Curseur de la page (null : première page)
+ * @returns {Promise<{items: Array, nextCursor: string|null}>} Projets de la page
+ * et curseur de la suivante
  */
-export const getProjects = async () => {
+export const getProjects = async (cursor = null) => {
   try {
-    return await api.get('project').json();
+    return await getPage('project', cursor);
   } catch (error) {
     console.error('Error fetching projects:', error);
     throw error;
@@ -24,7 +24,10 @@ import {
 } from "lucide-react";
 import {
   chats,
+  chatsNextCursor,
+  isLoadingMoreChats,
   fetchChats,
+  fetchMoreChats,
   deleteChat,
   updateChatTitle,
 } from "../store/chatStore";
@@ -35,6 +38,8 @@ const Sidebar = ({ isOpen, onClose }) => {
   const navigate = useNavigate();
   const location = useLocation();
   const $chats = useStore(chats);
+  const $chatsNextCursor = useStore(chatsNextCursor);
+  const $isLoadingMoreChats = useStore(isLoadingMoreChats);
   const [isLoading, setIsLoading] = useState(false);
   const [searchTerm, setSearchTerm] = useState("");
   const [editingChatId, setEditingChatId] = useState(null);
@@ -308,6 +313,17 @@ const Sidebar = ({ isOpen, onClose }) => {
                     {searchTerm ? "Aucun résultat" : "Aucune conversation"}
                   </div>
                 )}
+
+                {/* Conversations plus anciennes, chargées à la demande */}
+                {isOpen && $chatsNextCursor && (
+                  <button
+                    onClick={fetchMoreChats}
+                    disabled={$isLoadingMoreChats}
+                    className="w-full py-1.5 px-3 text-left text-sm rounded-md text-primary-600 dark:text-primary-400 hover:bg-dark-100 dark:hover:bg-dark-700 disabled:opacity-50"
+                  >
+                    {$isLoadingMoreChats ? "Chargement..." : "Charger plus"}
+                  </button>
+                )}
               </div>
             )}
           </div>
@@ -2,7 +2,13 @@
 import React, { useState, useRef } from 'react';
 import { X, Search, Upload, FileText, Check, Loader } from 'lucide-react';
 import { toast } from 'react-hot-toast';
-import { uploadDocument } from '../../store/knowledgeStore';
+import { useStore } from '@nanostores/react';
+import {
+  uploadDocument,
+  documentsNextCursor,
+  isLoadingMoreDocuments,
+  fetchMoreDocuments,
+} from '../../store/knowledgeStore';
 import Modal from '../ui/Modal';
 
 const DocumentSelectionModal = ({ 
@@ -18,6 +24,8 @@ const DocumentSelectionModal = ({
   const [localSelectedDocs, setLocalSelectedDocs] = useState(selectedDocs);
   const fileInputRef = useRef(null);
   const [file, setFile] = useState(null);
+  const $nextCursor = useStore(documentsNextCursor);
+  const $isLoadingMore = useStore(isLoadingMoreDocuments);
   
   // Filter documents based on search term
   const filteredDocuments = searchTerm 
@@ -255,6 +263,18 @@ const DocumentSelectionModal = ({
             ))}
           </div>
         )}
+
+        {/* Documents plus anciens, chargés à la demande */}
+        {$nextCursor && (
+          <button
+            onClick={fetchMoreDocuments}
+            disabled={$isLoadingMore}
+            className="btn btn-ghost btn-sm w-full mt-2"
+          >
+            {$isLoadingMore && <Loader size={16} className="animate-spin mr-2" />}
+            Charger plus de documents
+          </button>
+        )}
       </div>
     </Modal>
   );
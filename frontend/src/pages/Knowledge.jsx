@@ -27,8 +27,11 @@ import {
 } from 'lucide-react';
 import { 
   documents, 
+  documentsNextCursor,
   isLoadingDocuments, 
+  isLoadingMoreDocuments,
   fetchDocuments, 
+  fetchMoreDocuments,
   uploadDocument, 
   deleteDocument, 
   downloadDocument 
@@ -37,6 +40,8 @@ import {
 const Knowledge = () => {
   const $documents = useStore(documents);
   const $isLoading = useStore(isLoadingDocuments);
+  const $nextCursor = useStore(documentsNextCursor);
+  const $isLoadingMore = useStore(isLoadingMoreDocuments);
   const [searchTerm, setSearchTerm] = useState('');
   const [isUploading, setIsUploading] = useState(false);
   const [showUploadForm, setShowUploadForm] = useState(false);
@@ -622,6 +627,20 @@ const Knowledge = () => {
               </div>
             </div>
           )}
+
+          {/* Documents plus anciens, chargés à la demande */}
+          {$nextCursor && (
+            <div className="flex justify-center mt-6">
+              <button
+                onClick={fetchMoreDocuments}
+                disabled={$isLoadingMore}
+                className="flex items-center gap-2 px-4 py-2 text-sm text-primary-600 dark:text-primary-400 border border-dark-200 dark:border-dark-700 rounded-lg hover:bg-light-100 dark:hover:bg-dark-700 transition-colors disabled:opacity-50"
+              >
+                {$isLoadingMore && <Loader size={16} className="animate-spin" />}
+                Charger plus de documents
+              </button>
+            </div>
+          )}
         </>
       ) : (
         <div className="flex flex-col items-center justify-center py-16 text-center">
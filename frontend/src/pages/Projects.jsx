@@ -30,7 +30,9 @@ import NewProjectModal from "../components/projects/NewProjectModal";
 const Projects = () => {
   const navigate = useNavigate();
   const [projects, setProjects] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState("");
   const [showNewProjectModal, setShowNewProjectModal] = useState(false);
   const [newProjectTitle, setNewProjectTitle] = useState("");
@@ -72,8 +74,9 @@ const Projects = () => {
     const fetchProjects = async () => {
       try {
         setLoading(true);
-        const projects = await projectApi.getProjects();
-        setProjects(projects);
+        const { items, nextCursor } = await projectApi.getProjects();
+        setProjects(items);
+        setNextCursor(nextCursor);
       } catch (error) {
         console.error("Erreur lors du chargement des projets:", error);
         toast.error("Impossible de charger les projets");
@@ -85,6 +88,22 @@ const Projects = () => {
     fetchProjects();
   }, []);
 
+  // Charger la page suivante des projets
+  const handleLoadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const page = await projectApi.getProjects(nextCursor);
+      setProjects((current) => [...current, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Erreur lors du chargement des projets:", error);
+      toast.error("Impossible de charger les projets");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Filtrer et trier les projets
   const filteredAndSortedProjects = () => {
     let result = [...projects];
@@ -494,6 +513,20 @@ const Projects = () => {
               </div>
             </div>
           )}
+
+          {/* Projets plus anciens, chargés à la demande */}
+          {nextCursor && (
+            <div className="flex justify-center mt-6">
+              <button
+                onClick={handleLoadMore}
+                disabled={loadingMore}
+                className="flex items-center gap-2 px-4 py-2 text-sm text-primary-600 dark:text-primary-400 border border-dark-200 dark:border-dark-700 rounded-lg hover:bg-light-100 dark:hover:bg-dark-700 transition-colors disabled:opacity-50"
+              >
+                {loadingMore && <Loader size={16} className="animate-spin" />}
+                Charger plus de projets
+              </button>
+            </div>
+          )}
         </>
       ) : (
         <div className="flex flex-col items-center justify-center py-16 text-center">
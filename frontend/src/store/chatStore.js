@@ -1,10 +1,13 @@
 // src/store/chatStore.js
 import { atom, map } from "nanostores";
-import api from "../api/config";
+import api, { getPage } from "../api/config";
 import { toast } from "react-hot-toast";
 
 // Stores for chats
 export const chats = atom([]);
+// Cursor of the next page of chats (null when all are loaded)
+export const chatsNextCursor = atom(null);
+export const isLoadingMoreChats = atom(false);
 export const currentChat = map({
   id: null,
   messages: [],
@@ -17,18 +20,37 @@ export const currentChat = map({
 export const models = atom([]);
 export const selectedModel = atom("gemini-2.0-flash-lite");
 
-// Fetch all chats
+// Fetch the first page of chats
 export const fetchChats = async () => {
   try {
-    const response = await api.get("chat").json();
-    chats.set(response);
-    return response;
+    const { items, nextCursor } = await getPage("chat");
+    chats.set(items);
+    chatsNextCursor.set(nextCursor);
+    return items;
   } catch (error) {
     console.error("Error fetching chats:", error);
     return [];
   }
 };
 
+// Fetch the next page of chats
+export const fetchMoreChats = async () => {
+  const cursor = chatsNextCursor.get();
+  if (!cursor || isLoadingMoreChats.get()) return [];
+  try {
+    isLoadingMoreChats.set(true);
+    const { items, nextCursor } = await getPage("chat", cursor);
+    chats.set([...chats.get(), ...items]);
+    chatsNextCursor.set(nextCursor);
+    return items;
+  } catch (error) {
+    console.error("Error fetching more chats:", error);
+    return [];
+  } finally {
+    isLoadingMoreChats.set(false);
+  }
+};
+
 export const createChat = async (
   model = "gemini-2.0-flash-lite",
   systemPrompt = null
@@ -273,10 +295,13 @@ export const sendMessage = async (content, selectedDocs = [], streaming = true)
             );
 
             if (messageIndex !== -1) {
-              // Create updated message with new content
+              // Create updated message with new content (a resync event
+              // carries the whole content, replacing what was received)
               const updatedMessage = {
                 ...messages[messageIndex],
-                content: messages[messageIndex].content + content,
+                content: data.replace
+                  ? content
+                  : messages[messageIndex].content + content,
               };
 
               // If stream is done, remove the streaming flag
@@ -1,21 +1,25 @@
 // src/store/knowledgeStore.js
 import { atom } from 'nanostores';
-import api from '../api/config';
+import api, { getPage } from '../api/config';
 
 // Store for knowledge base
 export const documents = atom([]);
+// Cursor of the next page of documents (null when all are loaded)
+export const documentsNextCursor = atom(null);
 export const isLoadingDocuments = atom(false);
+export const isLoadingMoreDocuments = atom(false);
 export const searchResults = atom([]);
 export const isSearching = atom(false);
 
-// Fetch documents
+// Fetch the first page of documents
 export const fetchDocuments = async () => {
   try {
     isLoadingDocuments.set(true);
-    const response = await api.get('knowledge/documents').json();
-    documents.set(response);
+    const { items, nextCursor } = await getPage('knowledge/documents');
+    documents.set(items);
+    documentsNextCursor.set(nextCursor);
     isLoadingDocuments.set(false);
-    return response;
+    return items;
   } catch (error) {
     console.error('Error fetching documents:', error);
     isLoadingDocuments.set(false);
@@ -23,6 +27,24 @@ export const fetchDocuments = async () => {
   }
 };
 
+// Fetch the next page of documents
+export const fetchMoreDocuments = async () => {
+  const cursor = documentsNextCursor.get();
+  if (!cursor || isLoadingMoreDocuments.get()) return [];
+  try {
+    isLoadingMoreDocuments.set(true);
+    const { items, nextCursor } = await getPage('knowledge/documents', cursor);
+    documents.set([...documents.get(), ...items]);
+    documentsNextCursor.set(nextCursor);
+    return items;
+  } catch (error) {
+    console.error('Error fetching more documents:', error);
+    return [];
+  } finally {
+    isLoadingMoreDocuments.set(false);
+  }
+};
+
 // Upload a document
 export const uploadDocument = async (title, file) => {
   try {